@@ -3,13 +3,64 @@ Utilities for client communication with the trusted server.
 You should not need to change this file.
 """
 
-import json
+import struct
 import time
-from typing import Union, Tuple
+from typing import Dict, List, Mapping, Optional, Sequence, Union, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from secret_sharing import Share
+from metrics import Metrics
+from secret_sharing import Share, ShareVector, deserialize_shares
+from transport import Transport
+
+
+# Header of each entry of a batch: length of the key and length of the message.
+BATCH_ENTRY = struct.Struct(">HI")
+
+
+def encode_batch(messages: Mapping[str, Union[bytes, str]]) -> bytes:
+    """
+    Encode messages indexed by key into the body of a batch request.
+    Each entry is the length of the key and of the message, followed by the key and the message.
+    """
+    entries = []
+    for key, message in messages.items():
+        key_bytes = key.encode("utf-8")
+        message_bytes = message.encode("utf-8") if isinstance(message, str) else message
+        entries += [BATCH_ENTRY.pack(len(key_bytes), len(message_bytes)), key_bytes, message_bytes]
+    return b"".join(entries)
+
+
+def decode_batch(body: bytes) -> Dict[str, bytes]:
+    """
+    Decode the body of a batch request.
+    """
+    messages = {}
+    offset = 0
+    while offset < len(body):
+        key_length, message_length = BATCH_ENTRY.unpack_from(body, offset)
+        offset += BATCH_ENTRY.size
+        key = body[offset:offset + key_length].decode("utf-8")
+        offset += key_length
+        messages[key] = body[offset:offset + message_length]
+        offset += message_length
+    return messages
+
+
+def encode_keys(keys: List[str]) -> bytes:
+    """
+    Encode the keys of the messages requested in a batch request, one per line.
+    """
+    return "\n".join(keys).encode("utf-8")
+
+
+def decode_keys(body: bytes) -> List[str]:
+    """
+    Decode the keys of the messages requested in a batch request.
+    """
+    return body.decode("utf-8").split("\n") if body else []
 
 
 def sanitize_url_param(url_param: Union[bytes, str]) -> str:
@@ -26,7 +77,7 @@ def sanitize_url_param(url_param: Union[bytes, str]) -> str:
     return url_param.replace("/", "_").replace("+", "-") # type: ignore
 
 
-class Communication:
+class Communication(Transport):
     """
     Network communications with the server.
 
@@ -36,6 +87,16 @@ class Communication:
         client_id: Identifier of this client
         poll_delay: delay between requests in seconds (default: 0.2 s)
         protocol: network protocol to use (default: "http")
+        wait_timeout: time the server may hold a retrieval request until the message arrives,
+            in seconds (default: 10 s). If 0, messages are retrieved by polling every poll_delay.
+        timeout: time to wait for a message before giving up, in seconds (default: 30 s)
+        pool_size: number of keep-alive connections kept open to the server (default: 4)
+        retries: number of times a request is retried when it cannot connect to the server
+            (default: 3)
+        session_id: session of the computation on the server, or None for the default session
+        quiet: if set, the requests are not logged (default: False)
+        metrics: requests, bytes, polls, time spent sending, time blocked waiting for messages and
+            time waiting for the TTP, per label and peer
     """
 
     def __init__(
@@ -44,11 +105,59 @@ class Communication:
             server_port: int,
             client_id: str,
             poll_delay: float = 0.2,
-            protocol: str = "http"
+            protocol: str = "http",
+            wait_timeout: float = 10.0,
+            pool_size: int = 4,
+            retries: int = 3,
+            session_id: Optional[str] = None,
+            timeout: float = 30.0,
+            quiet: bool = False
     ):
-        self.base_url = f"{protocol}://{server_host}:{server_port}"
+        self.server_url = f"{protocol}://{server_host}:{server_port}"
+        self.session_id = session_id
+        # Every route of a session is under the prefix of the session.
+        if session_id is None:
+            self.base_url = self.server_url
+        else:
+            self.base_url = f"{self.server_url}/sessions/{sanitize_url_param(session_id)}"
         self.client_id = client_id
         self.poll_delay = poll_delay
+        self.wait_timeout = wait_timeout
+        self.timeout = timeout
+        self.quiet = quiet
+
+        # All the requests of the party go through the same pool of persistent connections.
+        # Only the requests which did not reach the server are retried: a retrieval uses up its
+        # messages on the server, so retrying it once the server served it would lose them.
+        retry = Retry(
+            total=retries, connect=retries, read=0, status=0, backoff_factor=0.1,
+            allowed_methods=None
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount(f"{protocol}://", adapter)
+
+        self.metrics = Metrics()
+        self.session.hooks["response"].append(self._count_response)
+
+
+    def _log(self, message: str) -> None:
+        """
+        Log a request, unless the client is quiet.
+        """
+        if not self.quiet:
+            print(message)
+
+
+    def _count_response(self, response: requests.Response, *args, **kwargs) -> None:
+        """
+        Count the traffic of a request.
+        """
+        self.metrics.add("requests")
+        body = response.request.body
+        self.metrics.add("bytes_sent", len(body) if isinstance(body, (bytes, str)) else 0)
+        self.metrics.add("bytes_received", len(response.content))
+        self.metrics.add("request_time", response.elapsed.total_seconds())
 
 
     def send_private_message(
@@ -66,8 +175,11 @@ class Communication:
         label_san = sanitize_url_param(label)
 
         url = f"{self.base_url}/private/{client_id_san}/{receiver_id_san}/{label_san}"
-        print(f"POST {url}")
-        requests.post(url, message)
+        self._log(f"POST {url}")
+        with self.metrics.timer("send_time"):
+            res = self.session.post(url, message)
+        res.raise_for_status()
+        self.metrics.add("messages_sent", label=label_san, peer=receiver_id)
 
 
     def retrieve_private_message(
@@ -82,14 +194,7 @@ class Communication:
         label_san = sanitize_url_param(label)
 
         url = f"{self.base_url}/private/{client_id_san}/{label_san}"
-        # We can either use a websocket, or do some polling, but websockets would require asyncio.
-        # So we are doing polling to avoid introducing a new programming paradigm.
-        while True:
-            print(f"GET  {url}")
-            res = requests.get(url)
-            if res.status_code == 200:
-                return res.content
-            time.sleep(self.poll_delay)
+        return self._wait_message(url, label_san)
 
 
     def publish_message(
@@ -105,8 +210,11 @@ class Communication:
         label_san = sanitize_url_param(label)
 
         url = f"{self.base_url}/public/{client_id_san}/{label_san}"
-        print(f"POST {url}")
-        requests.post(url, message)
+        self._log(f"POST {url}")
+        with self.metrics.timer("send_time"):
+            res = self.session.post(url, message)
+        res.raise_for_status()
+        self.metrics.add("messages_sent", label=label_san)
 
 
     def retrieve_public_message(
@@ -124,14 +232,135 @@ class Communication:
 
         url = f"{self.base_url}/public/{client_id_san}/{sender_id_san}/{label_san}"
 
-        # We can either use a websocket, or do some polling, but websockets would require asyncio.
-        # So we are doing polling to avoid introducing a new programming paradigm.
+        return self._wait_message(url, label_san, sender_id)
+
+
+    def send_private_messages(
+            self,
+            receiver_id: str,
+            messages: Dict[str, Union[bytes, str]]
+        ) -> None:
+        """
+        Send several private messages to the same receiver, indexed by label, in one request.
+        """
+
+        client_id_san = sanitize_url_param(self.client_id)
+        receiver_id_san = sanitize_url_param(receiver_id)
+        messages_san = {sanitize_url_param(label): m for label, m in messages.items()}
+
+        url = f"{self.base_url}/batch/private/{client_id_san}/{receiver_id_san}"
+        self._log(f"POST {url} ({len(messages)} messages)")
+        with self.metrics.timer("send_time"):
+            res = self.session.post(url, encode_batch(messages_san))
+        res.raise_for_status()
+        for label_san in messages_san:
+            self.metrics.add("messages_sent", label=label_san, peer=receiver_id)
+
+
+    def retrieve_private_messages(
+            self,
+            labels: List[str]
+        ) -> List[bytes]:
+        """
+        Retrieve several private messages from the server in one request.
+        """
+
+        client_id_san = sanitize_url_param(self.client_id)
+
+        url = f"{self.base_url}/batch/private/{client_id_san}"
+        labels_san = [sanitize_url_param(label) for label in labels]
+        return self._wait_messages(url, labels_san, [(label, None) for label in labels_san])
+
+
+    def retrieve_public_messages(
+            self,
+            keys: List[Tuple[str, str]]
+        ) -> List[bytes]:
+        """
+        Retrieve several public messages, given as (sender_id, label) pairs, in one request.
+        """
+
+        client_id_san = sanitize_url_param(self.client_id)
+
+        url = f"{self.base_url}/batch/public/{client_id_san}"
+        origins = [(sanitize_url_param(label), sender_id) for sender_id, label in keys]
+        keys_san = [f"{sanitize_url_param(sender_id)}/{label}" for label, sender_id in origins]
+        return self._wait_messages(url, keys_san, origins)
+
+
+    def _wait_messages(
+            self,
+            url: str,
+            keys: List[str],
+            origins: Sequence[Tuple[str, Optional[str]]]
+        ) -> List[bytes]:
+        """
+        Get several messages from the server, waiting until all of them are available.
+        Each request only asks for the messages that are still missing.
+        The origins are the label and the sender, if known, of each message, for the metrics.
+        Raises TimeoutError if they are not all available within the timeout, and HTTPError if
+        the session does not exist (410) or the request fails.
+        """
+        params = {"wait": self.wait_timeout} if self.wait_timeout > 0 else None
+        messages: Dict[str, bytes] = {}
+        start = time.perf_counter()
+        while True:
+            missing = [key for key in keys if key not in messages]
+            self._log(f"POST {url} ({len(missing)} messages)")
+            res = self.session.post(url, encode_keys(missing), params=params)
+            res.raise_for_status()
+            received = decode_batch(res.content)
+            messages.update(received)
+
+            # Time waited for each message, until it arrived.
+            elapsed = time.perf_counter() - start
+            for key, (label, peer) in zip(keys, origins):
+                if key in received:
+                    self.metrics.add("wait_time", elapsed, label, peer)
+            self.metrics.add("polls")
+
+            if len(messages) == len(set(keys)):
+                self.metrics.add("blocked_time", elapsed)
+                return [messages[key] for key in keys]
+            if elapsed > self.timeout:
+                missing = [key for key in keys if key not in messages]
+                raise TimeoutError(f"{len(missing)} messages not received, e.g. {missing[0]}")
+            if params is None:
+                time.sleep(self.poll_delay)
+
+
+    def _wait_message(
+            self,
+            url: str,
+            label: str,
+            peer: Optional[str] = None
+        ) -> bytes:
+        """
+        Get a message from the server, waiting until it is available.
+        The server holds the request until the message arrives (long polling). If wait_timeout
+        is 0, we poll every poll_delay seconds instead.
+        The label and the sender, if known, of the message are recorded in the metrics.
+        Raises TimeoutError if the message is not available within the timeout, and HTTPError if
+        the session does not exist (410) or the request fails.
+        """
+        params = {"wait": self.wait_timeout} if self.wait_timeout > 0 else None
+        start = time.perf_counter()
         while True:
-            print(f"GET  {url}")
-            res = requests.get(url)
+            self._log(f"GET  {url}")
+            res = self.session.get(url, params=params)
+            self.metrics.add("polls", label=label, peer=peer)
             if res.status_code == 200:
+                elapsed = time.perf_counter() - start
+                self.metrics.add("wait_time", elapsed, label, peer)
+                self.metrics.add("blocked_time", elapsed)
                 return res.content
-            time.sleep(self.poll_delay)
+            # A missing message is retried, any other error is raised.
+            if res.status_code != 404:
+                res.raise_for_status()
+            if time.perf_counter() - start > self.timeout:
+                raise TimeoutError(f"Message {label} not received")
+            if params is None:
+                time.sleep(self.poll_delay)
 
 
     def retrieve_beaver_triplet_shares(
@@ -146,7 +375,87 @@ class Communication:
         op_id_san = sanitize_url_param(op_id)
 
         url = f"{self.base_url}/shares/{client_id_san}/{op_id_san}"
-        print(f"GET  {url}")
+        self._log(f"GET  {url}")
 
-        res = requests.get(url)
-        return tuple([Share.deserialize(s) for s in json.loads(res.text)]) # type: ignore
+        with self.metrics.timer("ttp_time"):
+            res = self.session.get(url)
+        res.raise_for_status()
+        self.metrics.add("triplets")
+        return tuple(deserialize_shares(res.content)) # type: ignore
+
+
+    def _post_triplets(self, op_ids: List[str]) -> bytes:
+        """
+        Retrieve the serialized triplets of shares of several operations in one request.
+        """
+
+        client_id_san = sanitize_url_param(self.client_id)
+
+        url = f"{self.base_url}/batch/shares/{client_id_san}"
+        self._log(f"POST {url} ({len(op_ids)} triplets)")
+
+        with self.metrics.timer("ttp_time"):
+            res = self.session.post(url, encode_keys([sanitize_url_param(op_id) for op_id in op_ids]))
+        res.raise_for_status()
+        self.metrics.add("triplets", len(op_ids))
+        return res.content
+
+
+    def retrieve_beaver_triplet_shares_batch(
+            self,
+            op_ids: List[str]
+        ) -> List[Tuple[Share, Share, Share]]:
+        """
+        Retrieve the triplets of shares of several operations in one request.
+        """
+        shares = deserialize_shares(self._post_triplets(op_ids))
+        return [tuple(shares[i:i + 3]) for i in range(0, len(shares), 3)] # type: ignore
+
+
+    def retrieve_beaver_triplet_vectors(
+            self,
+            op_ids: List[str]
+        ) -> Tuple[ShareVector, ShareVector, ShareVector]:
+        """
+        Retrieve the triplets of shares of several operations in one request, decoded straight
+        into vectors.
+        """
+        shares = ShareVector.deserialize(self._post_triplets(op_ids))
+        return shares[0::3], shares[1::3], shares[2::3]
+
+
+    def open_session(
+            self,
+            participant_ids: List[str]
+        ) -> None:
+        """
+        Open the session of this client on the server, with the given participants.
+        Every participant may open it: once the session exists, this has no effect.
+        """
+        assert self.session_id is not None
+
+        url = self.base_url
+        self._log(f"POST {url}")
+        res = self.session.post(url, encode_keys(participant_ids))
+        res.raise_for_status()
+
+
+    def leave_session(self) -> None:
+        """
+        Leave the session of this client. The server frees the session once all its participants
+        left it.
+        """
+        assert self.session_id is not None
+
+        client_id_san = sanitize_url_param(self.client_id)
+
+        url = f"{self.base_url}/{client_id_san}"
+        self._log(f"DELETE {url}")
+        self.session.delete(url)
+
+
+    def close(self) -> None:
+        """
+        Close the connections to the server.
+        """
+        self.session.close()
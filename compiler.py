@@ -0,0 +1,249 @@
+"""
+Compiler lowering arithmetic expressions into a flat program executed by the SMC parties.
+
+Every node of the expression is assigned an integer register and translated into a single
+instruction, so that a party can evaluate the circuit with one loop instead of walking the
+expression graph. Instructions are topologically ordered and grouped by multiplicative depth:
+the Beaver multiplications of a given depth are followed by an OPEN instruction, which opens
+all their [d] and [e] values in a single round.
+
+A compiled program can be saved in a cache of circuits, under the hash of its content, and loaded
+from it by every party instead of compiling the expression again.
+
+Example:
+>>> alice_secret = Secret()
+>>> bob_secret = Secret()
+>>> program = compile_expression(alice_secret * bob_secret + Scalar(2))
+>>> digest = save_program(program)
+>>> program = load_program(digest)
+"""
+
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from expression import (
+    AddKOp,
+    AddOp,
+    Expression,
+    LinearOp,
+    MultKOp,
+    MultOp,
+    Scalar,
+    Secret,
+    SubOp,
+    linearize,
+    operands,
+    simplify,
+)
+
+
+# Opcodes. An instruction is a tuple (opcode, dest, a, b), where a and b are registers unless
+# stated otherwise.
+SECRET = 0  # a is the id of the secret
+CONST = 1   # a is the value of the constant
+ADD = 2
+ADDK = 3    # b is the value of the constant
+SUB = 4
+MULTK = 5   # b is the value of the constant
+MULT = 6    # Beaver multiplication, completed by the next OPEN
+OPEN = 7    # dest is the multiplicative depth of the multiplications to open
+LINEAR = 8  # a is a list of (register, coefficient) pairs, b is the constant term
+
+Instruction = Tuple[int, int, Any, Any]
+
+# Directory of the cache of compiled circuits.
+CACHE_DIR = os.environ.get("SMC_CIRCUIT_CACHE", os.path.join(tempfile.gettempdir(), "smc_circuits"))
+# Version of the serialized programs, part of their content hash.
+PROGRAM_VERSION = 2
+
+
+class Program:
+    """
+    A compiled expression.
+
+    Attributes:
+        instructions: Instructions in execution order
+        num_registers: Number of registers needed to execute the program
+        output: Register holding the value of the expression
+        op_ids: Id of the MultOp corresponding to each MULT destination register
+        label: Id of the compiled expression, from which the labels of its messages are derived
+    """
+
+    __slots__ = ("instructions", "num_registers", "output", "op_ids", "label")
+
+    def __init__(
+            self,
+            instructions: List[Instruction],
+            num_registers: int,
+            output: int,
+            op_ids: Dict[int, int],
+            label: int = 0
+        ):
+        self.instructions = instructions
+        self.num_registers = num_registers
+        self.output = output
+        self.op_ids = op_ids
+        self.label = label
+
+
+    def __len__(self):
+        return len(self.instructions)
+
+
+    def serialize(self) -> bytes:
+        """
+        Generate a representation of the program, identical for identical programs.
+        """
+        fields = (
+            PROGRAM_VERSION, self.instructions, self.num_registers, self.output, self.op_ids,
+            self.label
+        )
+        return pickle.dumps(fields, protocol=4)
+
+
+    @staticmethod
+    def deserialize(serialized: bytes) -> "Program":
+        """
+        Restore a program from its serialized representation. It must come from a trusted source,
+        e.g. be checked against its content hash.
+        """
+        version, *fields = pickle.loads(serialized)
+        if version != PROGRAM_VERSION:
+            raise ValueError("Invalid program encoding")
+        return Program(*fields)
+
+
+def program_digest(serialized: bytes) -> str:
+    """
+    Content hash of a serialized program.
+    """
+    return hashlib.sha256(serialized).hexdigest()
+
+
+def save_program(program: Program, cache_dir: str = CACHE_DIR) -> str:
+    """
+    Save a program in the cache of circuits, and return its content hash.
+    """
+    serialized = program.serialize()
+    digest = program_digest(serialized)
+    path = os.path.join(cache_dir, f"{digest}.circuit")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written under a temporary name, so that a party never loads a partial file.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(serialized)
+        os.replace(tmp_path, path)
+    return digest
+
+
+@functools.lru_cache(maxsize=16)
+def load_program(digest: str, cache_dir: str = CACHE_DIR) -> Program:
+    """
+    Load a program from the cache of circuits, given its content hash. The programs loaded by a
+    process are kept in memory for the next runs.
+    """
+    with open(os.path.join(cache_dir, f"{digest}.circuit"), "rb") as f:
+        serialized = f.read()
+    if program_digest(serialized) != digest:
+        raise ValueError(f"Corrupted circuit {digest}")
+    return Program.deserialize(serialized)
+
+
+def compile_circuit(expr: Expression) -> Program:
+    """
+    Simplify, linearize and compile the expression computed by the parties. The program is labeled
+    with the id of the given expression.
+    """
+    program = compile_expression(linearize(simplify(expr)))
+    program.label = expr.id
+    return program
+
+
+def compile_expression(expr: Expression) -> Program:
+    """
+    Lower an expression into a program.
+
+    Nodes are identified by their id, so a subexpression referenced several times is computed in
+    a single register, and each multiplication is opened exactly once.
+    """
+    # Nodes in post-order, with the multiplicative depth of each of them. The expression is
+    # walked with an explicit stack, so the depth of the circuit is not bounded by the recursion
+    # limit.
+    nodes: List[Expression] = []
+    depths: Dict[int, int] = {}
+    stack: List[Expression] = [expr]
+
+    while stack:
+        node = stack[-1]
+        if node.id in depths:
+            stack.pop()
+            continue
+
+        if isinstance(node, (AddKOp, MultKOp)):
+            # The scalar operand is inlined in the instruction.
+            children: Tuple[Expression, ...] = (node.a,)
+        else:
+            children = operands(node)
+        missing = [child for child in children if child.id not in depths]
+        if missing:
+            stack.extend(reversed(missing))
+            continue
+
+        stack.pop()
+        depth = max((depths[child.id] for child in children), default=0)
+        if isinstance(node, MultOp):
+            depth += 1
+        depths[node.id] = depth
+        nodes.append(node)
+
+    # A stable sort keeps the topological order inside a layer. The multiplications of a layer
+    # only depend on the previous layers, so they are scheduled first.
+    nodes.sort(key=lambda node: (depths[node.id], not isinstance(node, MultOp)))
+
+    registers = {node.id: reg for reg, node in enumerate(nodes)}
+    instructions: List[Instruction] = []
+    op_ids: Dict[int, int] = {}
+
+    for dest, node in enumerate(nodes):
+        if isinstance(node, Secret):
+            instructions.append((SECRET, dest, node.id, None))
+        elif isinstance(node, Scalar):
+            instructions.append((CONST, dest, node.value, None))
+        elif isinstance(node, AddOp):
+            instructions.append((ADD, dest, registers[node.a.id], registers[node.b.id]))
+        elif isinstance(node, AddKOp):
+            instructions.append((ADDK, dest, registers[node.a.id], node.b.value))
+        elif isinstance(node, SubOp):
+            instructions.append((SUB, dest, registers[node.a.id], registers[node.b.id]))
+        elif isinstance(node, MultKOp):
+            instructions.append((MULTK, dest, registers[node.a.id], node.b.value))
+        elif isinstance(node, LinearOp):
+            terms = [(registers[term.id], k) for term, k in node.terms]
+            instructions.append((LINEAR, dest, terms, node.constant))
+        elif isinstance(node, MultOp):
+            instructions.append((MULT, dest, registers[node.a.id], registers[node.b.id]))
+            op_ids[dest] = node.id
+        else:
+            raise TypeError(f"Cannot compile {node.__class__.__name__}")
+
+        # Close the layer once its last multiplication is scheduled.
+        last_mult = isinstance(node, MultOp) and (
+            dest + 1 == len(nodes)
+            or not isinstance(nodes[dest + 1], MultOp)
+            or depths[nodes[dest + 1].id] != depths[node.id]
+        )
+        if last_mult:
+            instructions.append((OPEN, depths[node.id], None, None))
+
+    return Program(instructions, len(nodes), registers[expr.id], op_ids, expr.id)
@@ -9,34 +9,68 @@ Example expression:
 MODIFY THIS FILE.
 """
 
-import base64
+import collections
+import hashlib
 import random
-from typing import Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 
-ID_BYTES = 4
+# Ids are integers of ID_BITS bits, which CPython stores in two 30-bit digits. The ids of a circuit
+# of 10^6 nodes collide with a probability below 10^-6.
+ID_BITS = 60
+# Number of recently built nodes kept for interning, see Expression.
+INTERNED_NODES = 1 << 12
 
 
-def gen_id() -> bytes:
-    id_bytes = bytearray(
-        random.getrandbits(8) for _ in range(ID_BYTES)
-    )
-    return base64.b64encode(id_bytes)
+def gen_id() -> int:
+    return random.getrandbits(ID_BITS)
+
+
+def structural_id(kind: str, *parts: Any) -> int:
+    """
+    Id of a node derived from its kind and from the ids or values defining it.
+    """
+    # The repr of the tuple is an unambiguous encoding of its items.
+    data = repr((kind, *parts)).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big") >> (64 - ID_BITS)
+
+
+# Mask of the structural ids of the operations, derived from the hash of their operand ids.
+ID_MASK = (1 << ID_BITS) - 1
+
+# Recently built nodes without an explicit id, indexed by their structural id.
+_interned: Dict[int, "Expression"] = {}
+# Recently built scalars without an explicit id, indexed by their value.
+_scalars: Dict[int, "Scalar"] = {}
+
+
+def _intern(table: Dict[int, Any], key: int, node: Any) -> Any:
+    """
+    Record a node in a table of interned nodes. A table is bounded by INTERNED_NODES and cleared
+    once full, so that it holds no reference to most of the nodes of a large circuit.
+    """
+    if len(table) >= INTERNED_NODES:
+        table.clear()
+    table[key] = node
+    return node
 
 
 class Expression:
     """
     Base class for an arithmetic expression.
+
+    Expressions may have millions of nodes, so every node class declares its attributes in
+    __slots__ instead of carrying a __dict__, and is built by __new__ alone.
+
+    A node built without an explicit id gets a structural id, and a recently built node with the
+    same id is returned instead of it, if any. Structurally identical subexpressions built close
+    to each other are thus shared, and the others still get the same id, so that the compiler
+    evaluates them once. Every secret is a distinct variable, with a random id.
     """
 
-    def __init__(
-            self,
-            id: Optional[bytes] = None
-        ):
-        # If ID is not given, then generate one.
-        if id is None:
-            id = gen_id()
-        self.id = id
+    __slots__ = ("id",)
+
+    id: int
 
     def __add__(self, other):
         return AddKOp(self, other) if isinstance(self, Scalar) or isinstance(other, Scalar) else AddOp(self, other)
@@ -60,39 +94,109 @@ class Expression:
 
 
     
-class AddOp ( Expression ) :
-    def __init__ ( self , a , b ,id: Optional[bytes] = None) :
-        self . a = a
-        self . b = b
-        super().__init__(id)
-
-class AddKOp ( Expression ) :
-    def __init__ ( self , a , b ,id: Optional[bytes] = None ) :
+class BinaryOp ( Expression ) :
+    """
+    Operation on two expressions a and b.
+
+    The structural id is the hash of the kind of the operation and of the ids of its operands: the
+    hash of a tuple of ints is the same in every process, unlike the hash of strings.
+    """
+
+    __slots__ = ("a", "b")
+
+    a: Expression
+    b: Expression
+
+    # Kind of the operation in the structural ids.
+    KIND = 0
+
+    def __new__ ( cls , a: Expression , b: Expression ,id: Optional[int] = None) :
+        if id is not None:
+            return cls._build(a, b, id)
+        id = hash((cls.KIND, a.id, b.id)) & ID_MASK
+        node = _interned.get(id)
+        if node is not None:
+            return node
+        return _intern(_interned, id, cls._build(a, b, id))
+
+    @classmethod
+    def _build(cls, a: Expression, b: Expression, id: int):
+        node = object.__new__(cls)
+        node.a = a
+        node.b = b
+        node.id = id
+        return node
+
+    def __getnewargs__(self):
+        return (self.a, self.b, self.id)
+
+class AddOp ( BinaryOp ) :
+    __slots__ = ()
+    KIND = 1
+
+class AddKOp ( BinaryOp ) :
+    """
+    Addition of an expression a and a scalar b, which may be given first.
+    """
+
+    __slots__ = ()
+    KIND = 2
+    b: "Scalar"
+
+    def __new__ ( cls , a: Expression , b: Expression ,id: Optional[int] = None ) :
         if isinstance(a, Scalar):
             a, b = b, a
-        self . a = a
-        self . b = b
-        super().__init__(id)
-
-class SubOp ( Expression ) :
-    def __init__ ( self , a , b ,id: Optional[bytes] = None) :
-        self . a = a
-        self . b = b
-        super().__init__(id)
-
-class MultOp ( Expression ) :
-    def __init__ ( self , a , b ,id: Optional[bytes] = None) :
-        self . a = a
-        self . b = b
-        super().__init__(id)
-
-class MultKOp ( Expression ) :
-    def __init__ ( self , a , b ,id: Optional[bytes] = None) :
+        return super().__new__(cls, a, b, id)
+
+class SubOp ( BinaryOp ) :
+    __slots__ = ()
+    KIND = 3
+
+class MultOp ( BinaryOp ) :
+    __slots__ = ()
+    KIND = 4
+
+class MultKOp ( BinaryOp ) :
+    """
+    Multiplication of an expression a by a scalar b, which may be given first.
+    """
+
+    __slots__ = ()
+    KIND = 5
+    b: "Scalar"
+
+    def __new__ ( cls , a: Expression , b: Expression ,id: Optional[int] = None) :
         if isinstance(a, Scalar):
             a, b = b, a
-        self . a = a
-        self . b = b
-        super().__init__(id)
+        return super().__new__(cls, a, b, id)
+
+class LinearOp ( Expression ) :
+    """
+    Linear combination sum(k_i * x_i) + constant of expressions x_i with public coefficients k_i.
+    """
+
+    __slots__ = ("terms", "constant")
+
+    terms: List[Tuple[Expression, int]]
+    constant: int
+
+    def __new__ ( cls , terms: List[Tuple[Expression, int]] , constant: int = 0 ,id: Optional[int] = None) :
+        interned = id is None
+        if id is None:
+            # The coefficients and the constant are unbounded, so they are hashed with the ids.
+            parts = [part for term, k in terms for part in (term.id, k)]
+            id = structural_id(cls.__name__, constant, *parts)
+            node = _interned.get(id)
+            if node is not None:
+                return node
+        node = object.__new__(cls)
+        node . terms = terms
+        node . constant = constant
+        node . id = id
+        return _intern(_interned, id, node) if interned else node
+
+    def __getnewargs__(self):
+        return (self.terms, self.constant, self.id)
 
 
 
@@ -100,21 +204,33 @@ class MultKOp ( Expression ) :
 class Scalar(Expression):
     """Term representing a scalar finite field value."""
 
-    def __init__(
-            self,
-            value: Optional[int] = 0,
-            id: Optional[bytes] = None
+    __slots__ = ("value",)
+
+    value: int
+
+    def __new__(
+            cls,
+            value: int = 0,
+            id: Optional[int] = None
         ):
-        self.value = value
-        super().__init__(id)
+        if id is None:
+            # Scalars are interned by value, their id is only computed for a new value.
+            node = _scalars.get(value)
+            if node is not None:
+                return node
+            return _intern(_scalars, value, cls(value, structural_id(cls.__name__, value)))
+        node = object.__new__(cls)
+        node.value = value
+        node.id = id
+        return node
 
 
-    def __repr__(self):
-        return f"{self.__class__.__name__}({repr(self.value)})"
+    def __getnewargs__(self):
+        return (self.value, self.id)
 
 
-    def __hash__(self):
-        return
+    def __repr__(self):
+        return f"{self.__class__.__name__}({repr(self.value)})"
 
 
     # Feel free to add as many methods as you like.
@@ -123,13 +239,23 @@ class Secret(Expression):
     """Term representing a secret finite field value (variable)."""
     """leaf,  """
 
-    def __init__(
-            self,
-            id: Optional[bytes] = None,
+    __slots__ = ("value",)
+
+    value: Optional[int]
+
+    def __new__(
+            cls,
+            id: Optional[int] = None,
             value: Optional[int] = None
         ):
-        super().__init__(id)
-        self.value  = value
+        node = object.__new__(cls)
+        node.id = gen_id() if id is None else id
+        node.value  = value
+        return node
+
+
+    def __getnewargs__(self):
+        return (self.id, self.value)
 
 
     def __repr__(self):
@@ -142,20 +268,230 @@ class Secret(Expression):
 
 
 
-##TODO this was added by me for debugging purposes  remove this
+def operands(expr: Expression) -> Tuple[Expression, ...]:
+    """
+    Return the operands of an expression, in evaluation order.
+    """
+    if isinstance(expr, BinaryOp):
+        return (expr.a, expr.b)
+    if isinstance(expr, LinearOp):
+        return tuple(term for term, _ in expr.terms)
+    return ()
+
+
+def postorder(expr: Expression) -> List[Expression]:
+    """
+    Return the distinct nodes of an expression, every node coming after its operands.
+    The expression is walked with an explicit stack, so its depth is not bounded.
+    """
+    nodes: List[Expression] = []
+    visited: Set[int] = set()
+    stack = [expr]
+    while stack:
+        node = stack[-1]
+        if node.id in visited:
+            stack.pop()
+            continue
+        missing = [child for child in operands(node) if child.id not in visited]
+        if missing:
+            stack.extend(reversed(missing))
+            continue
+        stack.pop()
+        visited.add(node.id)
+        nodes.append(node)
+    return nodes
+
+
+def simplify(expr: Expression) -> Expression:
+    """
+    Return an equivalent expression where the public constants are folded.
+
+    Scalar-only subexpressions are evaluated, additions of 0 and multiplications by 1 are dropped,
+    multiplications by 0 become constants, nested multiplications by constants are merged, and
+    the constants of linear subexpressions are hoisted so that they are added only once.
+
+    A rewritten node keeps the id of the node it replaces (nodes introduced by the rewriting get
+    ids derived from it), so every party obtains the same ids from the same expression.
+    """
+    simplified: Dict[int, Expression] = {}
+    for node in postorder(expr):
+        if isinstance(node, LinearOp):
+            terms = [(simplified[term.id], k) for term, k in node.terms]
+            simplified[node.id] = LinearOp(terms, node.constant, node.id)
+            continue
+        if not isinstance(node, BinaryOp):
+            # Scalars and secrets are kept as is.
+            simplified[node.id] = node
+            continue
+
+        a, b = simplified[node.a.id], simplified[node.b.id]
+        if isinstance(node, (AddOp, AddKOp)):
+            simplified[node.id] = _simplify_add(a, b, node.id)
+        elif isinstance(node, SubOp):
+            simplified[node.id] = _simplify_sub(a, b, node.id)
+        else:
+            simplified[node.id] = _simplify_mult(a, b, node.id)
+
+    return simplified[expr.id]
+
+
+def _derive_id(id: int) -> int:
+    """
+    Id of a node introduced when rewriting the node of the given id.
+    """
+    return structural_id("derived", id)
+
+
+def _split_constant(expr: Expression) -> Tuple[Expression, int]:
+    """
+    Split a simplified non-scalar expression into its non-constant part and its constant term.
+    """
+    if isinstance(expr, AddKOp):
+        return expr.a, expr.b.value
+    return expr, 0
+
+
+def _simplify_add(a: Expression, b: Expression, id: int) -> Expression:
+    if isinstance(a, Scalar):
+        a, b = b, a
+    if isinstance(b, Scalar):
+        if isinstance(a, Scalar):
+            return Scalar(a.value + b.value, id)
+        a, k = _split_constant(a)
+        k += b.value
+        return AddKOp(a, Scalar(k), id) if k != 0 else a
+
+    a, ka = _split_constant(a)
+    b, kb = _split_constant(b)
+    if ka + kb == 0:
+        return AddOp(a, b, id)
+    return AddKOp(AddOp(a, b, _derive_id(id)), Scalar(ka + kb), id)
+
+
+def _simplify_sub(a: Expression, b: Expression, id: int) -> Expression:
+    if isinstance(b, Scalar):
+        return _simplify_add(a, Scalar(-b.value), id)
+    if isinstance(a, Scalar):
+        # k - b = (-1) * b + k, so that k can be hoisted further.
+        return _simplify_add(_simplify_mult(b, Scalar(-1), _derive_id(id)), a, id)
+
+    a, ka = _split_constant(a)
+    b, kb = _split_constant(b)
+    if ka - kb == 0:
+        return SubOp(a, b, id)
+    return AddKOp(SubOp(a, b, _derive_id(id)), Scalar(ka - kb), id)
+
+
+def _simplify_mult(a: Expression, b: Expression, id: int) -> Expression:
+    if isinstance(a, Scalar):
+        a, b = b, a
+    if not isinstance(b, Scalar):
+        return MultOp(a, b, id)
+    if isinstance(a, Scalar):
+        return Scalar(a.value * b.value, id)
+
+    k = b.value
+    if k == 0:
+        return Scalar(0, id)
+    if k == 1:
+        return a
+    if isinstance(a, MultKOp):
+        return _simplify_mult(a.a, Scalar(a.b.value * k), id)
+    if isinstance(a, AddKOp):
+        # (x + k') * k = x * k + k' * k
+        return _simplify_add(_simplify_mult(a.a, b, _derive_id(id)), Scalar(a.b.value * k), id)
+    return MultKOp(a, b, id)
+
+
+LINEAR_OPS = (AddOp, AddKOp, SubOp, MultKOp)
+
+
+def linearize(expr: Expression) -> Expression:
+    """
+    Return an equivalent expression where every maximal linear subexpression is replaced by a
+    single LinearOp.
+
+    A linear region is made of AddOp, AddKOp, SubOp and MultKOp nodes, and is rooted at a node
+    whose value is used by a multiplication, by several nodes, or is the value of the expression.
+    Each region keeps the id of its root.
+    """
+    nodes = postorder(expr)
+
+    # Number of nodes using the value of each node. The scalar operand of AddKOp and MultKOp is
+    # inlined in the linear combination.
+    uses: Dict[int, int] = collections.Counter()
+    for node in nodes:
+        children = (node.a,) if isinstance(node, (AddKOp, MultKOp)) else operands(node)
+        for child in children:
+            uses[child.id] += 1
+
+    # Nodes whose value is used outside of linear subexpressions.
+    used_outside: Set[int] = set()
+    for node in nodes:
+        if not isinstance(node, LINEAR_OPS):
+            used_outside.update(child.id for child in operands(node))
+
+    def is_region_root(node: Expression) -> bool:
+        return isinstance(node, LINEAR_OPS) and (
+            node is expr or uses[node.id] != 1 or node.id in used_outside
+        )
+
+    rewritten: Dict[int, Expression] = {}
+    for node in nodes:
+        if isinstance(node, (Scalar, Secret)):
+            rewritten[node.id] = node
+        elif isinstance(node, LinearOp):
+            terms = [(rewritten[term.id], k) for term, k in node.terms]
+            rewritten[node.id] = LinearOp(terms, node.constant, node.id)
+        elif isinstance(node, MultOp):
+            rewritten[node.id] = MultOp(rewritten[node.a.id], rewritten[node.b.id], node.id)
+        elif is_region_root(node):
+            rewritten[node.id] = _collapse_region(node, rewritten, is_region_root)
+
+    return rewritten[expr.id]
+
+
+def _collapse_region(root: Expression, rewritten: Dict[int, Expression], is_region_root) -> LinearOp:
+    """
+    Compute the linear combination of a linear region, whose inputs are already rewritten.
+    """
+    coefficients: Dict[int, int] = collections.defaultdict(int)
+    inputs: Dict[int, Expression] = {}
+    constant = 0
+
+    stack = [(root, 1)]
+    while stack:
+        node, k = stack.pop()
+        if node is not root and (is_region_root(node) or not isinstance(node, LINEAR_OPS)):
+            if isinstance(node, Scalar):
+                constant += k * node.value
+            else:
+                coefficients[node.id] += k
+                inputs[node.id] = rewritten[node.id]
+        elif isinstance(node, AddOp):
+            stack += [(node.b, k), (node.a, k)]
+        elif isinstance(node, SubOp):
+            stack += [(node.b, -k), (node.a, k)]
+        elif isinstance(node, AddKOp):
+            constant += k * node.b.value
+            stack.append((node.a, k))
+        elif isinstance(node, MultKOp):
+            stack.append((node.a, k * node.b.value))
+
+    terms = [(inputs[id], k) for id, k in coefficients.items() if k != 0]
+    return LinearOp(terms, constant, root.id)
+
+
 def print_ast(expr, indent=0):
     """
-    Print an abstract syntax tree (AST) recursively.
-    """
-    if isinstance(expr, AddOp):
-        print(' ' * indent + 'AddOp')
-        print_ast(expr.a, indent+2)
-        print_ast(expr.b, indent+2)
-    elif isinstance(expr, MultOp):
-        print(' ' * indent + 'MultOp')
-        print_ast(expr.a, indent+2)
-        print_ast(expr.b, indent+2)
-    elif isinstance(expr, Scalar):
-        print(' ' * indent + 'Scalar({})'.format(expr.value))
-    elif isinstance(expr, Secret):
-        print(' ' * indent + 'Secret({})'.format(expr.value))
+    Print an abstract syntax tree (AST).
+    The tree is walked with an explicit stack, so arbitrarily deep expressions can be printed.
+    """
+    stack = [(expr, indent)]
+    while stack:
+        node, depth = stack.pop()
+        if isinstance(node, (Scalar, Secret)):
+            print(' ' * depth + '{}({})'.format(node.__class__.__name__, node.value))
+        else:
+            print(' ' * depth + node.__class__.__name__)
+        stack.extend((child, depth + 2) for child in reversed(operands(node)))
@@ -0,0 +1,186 @@
+"""
+Transport between SMC parties running in the same process, e.g. as threads.
+
+The parties exchange their messages through a MemoryHub, which plays the role of the relay server
+and of the trusted third party. Messages are passed by reference without any serialization
+beyond the one done by the parties, so many parties can be simulated to test the protocol logic
+independently of the network.
+
+Example:
+>>> hub = MemoryHub(["Alice", "Bob"])
+>>> alice = SMCParty("Alice", "", 0, protocol_spec, alice_values, transport=hub.transport("Alice"))
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from metrics import Metrics
+from secret_sharing import Share
+from transport import Transport
+from ttp import TrustedParamGenerator
+
+
+class MemoryHub:
+    """
+    Messages and Beaver triplets shared by the parties of a computation within a process. The
+    triplets are generated on demand.
+
+    As on the relay server, a private message is freed once retrieved by its receiver, and a
+    public message once retrieved by all the other participants.
+
+    Attributes:
+        participant_ids: IDs of the participating clients
+        timeout: time a party waits for its messages before giving up, in seconds (default: 30 s),
+            so that a party which crashed does not block the others forever
+    """
+
+    def __init__(self, participant_ids: List[str], timeout: float = 30.0):
+        self.participant_ids = list(participant_ids)
+        self.timeout = timeout
+        self.ttp = TrustedParamGenerator()
+        for participant in self.participant_ids:
+            self.ttp.add_participant(participant)
+
+        # Messages indexed by (kind, receiver or sender, label), with their number of readers left.
+        self.messages: Dict[Tuple[str, str, str], bytes] = {}
+        self.readers_left: Dict[Tuple[str, str, str], int] = {}
+        self.messages_changed = threading.Condition()
+
+
+    def transport(self, client_id: str) -> "MemoryTransport":
+        """
+        Transport of a participant.
+        """
+        return MemoryTransport(self, client_id)
+
+
+    def put(self, messages: Dict[Tuple[str, str, str], bytes], readers: int) -> None:
+        """
+        Store messages, each of them to be retrieved `readers` times.
+        """
+        with self.messages_changed:
+            for key, message in messages.items():
+                self.messages[key] = message
+                self.readers_left[key] = readers
+            self.messages_changed.notify_all()
+
+
+    def take(self, keys: List[Tuple[str, str, str]]) -> List[bytes]:
+        """
+        Wait until all the messages with the given keys are stored, and retrieve them.
+        Raises TimeoutError if they are not all stored within the timeout of the hub.
+        """
+        with self.messages_changed:
+            if not self.messages_changed.wait_for(
+                lambda: all(key in self.messages for key in keys), self.timeout
+            ):
+                missing = [key for key in keys if key not in self.messages]
+                raise TimeoutError(f"{len(missing)} messages not received, e.g. {missing[0]}")
+            messages = [self.messages[key] for key in keys]
+            for key in keys:
+                self.readers_left[key] -= 1
+                if self.readers_left[key] == 0:
+                    del self.messages[key]
+                    del self.readers_left[key]
+            return messages
+
+
+def _to_bytes(message: Union[bytes, str]) -> bytes:
+    return message.encode("utf-8") if isinstance(message, str) else message
+
+
+def _to_str(label: Union[bytes, str]) -> str:
+    return label.decode("utf-8") if isinstance(label, bytes) else label
+
+
+class MemoryTransport(Transport):
+    """
+    Transport of a party through a MemoryHub.
+
+    Attributes:
+        hub: Hub shared by the parties
+        client_id: Identifier of this client
+    """
+
+    def __init__(self, hub: MemoryHub, client_id: str):
+        self.hub = hub
+        self.client_id = client_id
+        self.metrics = Metrics()
+
+
+    def _take(self, keys: List[Tuple[str, str, str]], peers: List[Optional[str]]) -> List[bytes]:
+        """
+        Retrieve messages from the hub, recording the time waited for them.
+        """
+        start = time.perf_counter()
+        messages = self.hub.take(keys)
+        elapsed = time.perf_counter() - start
+        for (_, _, label), peer in zip(keys, peers):
+            self.metrics.add("wait_time", elapsed, label, peer)
+        self.metrics.add("blocked_time", elapsed)
+        return messages
+
+
+    def send_private_messages(
+            self,
+            receiver_id: str,
+            messages: Dict[str, Union[bytes, str]]
+        ) -> None:
+        with self.metrics.timer("send_time"):
+            self.hub.put({
+                ("private", receiver_id, _to_str(label)): _to_bytes(message)
+                for label, message in messages.items()
+            }, 1)
+        for label in messages:
+            self.metrics.add("messages_sent", label=_to_str(label), peer=receiver_id)
+
+
+    def retrieve_private_messages(
+            self,
+            labels: List[str]
+        ) -> List[bytes]:
+        keys = [("private", self.client_id, _to_str(label)) for label in labels]
+        return self._take(keys, [None] * len(keys))
+
+
+    def publish_message(
+            self,
+            label: str,
+            message: Union[bytes, str]
+        ) -> None:
+        readers = len(self.hub.participant_ids) - 1
+        if readers > 0:
+            with self.metrics.timer("send_time"):
+                self.hub.put({("public", self.client_id, _to_str(label)): _to_bytes(message)}, readers)
+        self.metrics.add("messages_sent", label=_to_str(label))
+
+
+    def retrieve_public_messages(
+            self,
+            keys: List[Tuple[str, str]]
+        ) -> List[bytes]:
+        hub_keys = [("public", sender_id, _to_str(label)) for sender_id, label in keys]
+        return self._take(hub_keys, [sender_id for sender_id, _ in keys])
+
+
+    def retrieve_beaver_triplet_shares(
+            self,
+            op_id: str
+        ) -> Tuple[Share, Share, Share]:
+        with self.metrics.timer("ttp_time"):
+            shares = self.hub.ttp.retrieve_share(self.client_id, _to_str(op_id))
+        self.metrics.add("triplets")
+        return shares
+
+
+    def retrieve_beaver_triplet_shares_batch(
+            self,
+            op_ids: List[str]
+        ) -> List[Tuple[Share, Share, Share]]:
+        with self.metrics.timer("ttp_time"):
+            triplets = self.hub.ttp.retrieve_shares(
+                self.client_id, [_to_str(op_id) for op_id in op_ids]
+            )
+        self.metrics.add("triplets", len(op_ids))
+        return triplets
@@ -0,0 +1,83 @@
+"""
+Metrics of the communications of the parties and of the server.
+"""
+
+import collections
+import contextlib
+import json
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+
+class Metrics:
+    """
+    Counters and timers, in total and per label and per peer, which can be exported as JSON.
+    The metrics may be updated by several threads.
+
+    Attributes:
+        totals: Total of each metric
+        by_label: Totals of each metric for every label
+        by_peer: Totals of each metric for every peer
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals: Dict[str, float] = collections.defaultdict(float)
+        self.by_label: Dict[str, Dict[str, float]] = collections.defaultdict(
+            lambda: collections.defaultdict(float)
+        )
+        self.by_peer: Dict[str, Dict[str, float]] = collections.defaultdict(
+            lambda: collections.defaultdict(float)
+        )
+
+
+    def add(
+            self,
+            name: str,
+            value: float = 1,
+            label: Optional[str] = None,
+            peer: Optional[str] = None
+        ) -> None:
+        """
+        Add a value to a metric, and to the totals of its label and its peer if given.
+        """
+        with self.lock:
+            self.totals[name] += value
+            if label is not None:
+                self.by_label[label][name] += value
+            if peer is not None:
+                self.by_peer[peer][name] += value
+
+
+    @contextlib.contextmanager
+    def timer(
+            self,
+            name: str,
+            label: Optional[str] = None,
+            peer: Optional[str] = None
+        ) -> Iterator[None]:
+        """
+        Add the time spent in a block to a metric, in seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, label, peer)
+
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Snapshot of the metrics.
+        """
+        with self.lock:
+            return {
+                "totals": dict(self.totals),
+                "by_label": {label: dict(values) for label, values in self.by_label.items()},
+                "by_peer": {peer: dict(values) for peer, values in self.by_peer.items()},
+            }
+
+
+    def to_json(self) -> str:
+        return json.dumps(self.summary(), indent=2, sort_keys=True)
@@ -0,0 +1,327 @@
+"""
+Direct communication between the SMC parties, over TCP connections between every pair of them.
+
+The private shares and the published openings are sent directly to their recipients, in one hop,
+instead of going through the relay server. The relay server (server.py) is only used to discover
+the addresses of the other parties, which every party publishes there, and to retrieve the Beaver
+triplets from the trusted third party.
+
+Every party listens for the connections of the others, and opens a connection to each of them on
+which it sends its messages. The messages use the frames of push_communication, and the received
+ones are stored in a local mailbox, from which the retrieve_* methods read.
+"""
+
+import asyncio
+import collections
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from communication import Communication
+from metrics import Metrics
+from push_communication import read_message, write_message
+from secret_sharing import Share, ShareVector
+from transport import Transport
+
+
+# Label under which every party publishes its address on the relay server, prefixed with the id
+# of the run.
+ADDRESS_LABEL = "p2p_address"
+
+
+def _to_bytes(message: Union[bytes, str]) -> bytes:
+    return message.encode("utf-8") if isinstance(message, str) else message
+
+
+def _to_str(label: Union[bytes, str]) -> str:
+    return label.decode("utf-8") if isinstance(label, bytes) else label
+
+
+class PeerCommunication(Transport):
+    """
+    Network communications of a party directly with the other parties.
+
+    Attributes:
+        server_host: hostname of the relay server, used for discovery and the Beaver triplets
+        server_port: port of the relay server
+        client_id: Identifier of this client
+        participant_ids: IDs of all the participating clients
+        session_id: session of the computation on the relay server, or None for the default one
+        run_id: id of the run of the computation, which scopes the addresses published on the
+            relay server, so that a party does not connect to the listener of another run
+        host: hostname on which this client accepts the connections of the other parties, and
+            which it publishes to them: it must be reachable by all of them (default: "localhost")
+        timeout: time to wait for the messages of the other parties before giving up, in seconds
+            (default: 30 s)
+        quiet: if set, the requests to the relay server are not logged (default: False)
+        metrics: messages, bytes, time spent sending and time blocked waiting for messages and
+            for the TTP, per label and peer, including the requests to the relay server
+    """
+
+    def __init__(
+            self,
+            server_host: str,
+            server_port: int,
+            client_id: str,
+            participant_ids: List[str],
+            session_id: Optional[str] = None,
+            run_id: str = "",
+            host: str = "localhost",
+            timeout: float = 30.0,
+            quiet: bool = False
+    ):
+        self.client_id = client_id
+        self.timeout = timeout
+        self.peer_ids = [pid for pid in participant_ids if pid != client_id]
+        self.metrics = Metrics()
+        self.relay = Communication(
+            server_host, server_port, client_id, session_id=session_id, quiet=quiet
+        )
+        # The requests to the relay server are part of the traffic of this party.
+        self.relay.metrics = self.metrics
+        if session_id is not None:
+            self.relay.open_session(participant_ids)
+
+        # Messages received from the other parties, indexed by (kind, sender, label). Each of them
+        # is removed once retrieved. Private messages are retrieved by label only, so the senders
+        # of each private label are indexed as well.
+        self.mailbox: Dict[Tuple[str, str, str], bytes] = {}
+        self.private_senders: Dict[str, Set[str]] = collections.defaultdict(set)
+        self.mailbox_changed = threading.Condition()
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.writers: Dict[str, asyncio.StreamWriter] = {}
+        port = self._run(self._listen(host))
+
+        # Discovery: publish the address of this party, then connect to the others.
+        address_label = f"{run_id}_{ADDRESS_LABEL}"
+        self.relay.publish_message(address_label, f"{host}:{port}")
+        addresses = self.relay.retrieve_public_messages(
+            [(peer_id, address_label) for peer_id in self.peer_ids]
+        )
+        for peer_id, address in zip(self.peer_ids, addresses):
+            peer_host, peer_port = address.decode("utf-8").rsplit(":", 1)
+            self._run(self._connect(peer_id, peer_host, int(peer_port)))
+
+
+    def _run(self, coroutine):
+        """
+        Run a coroutine in the event loop of the connections and wait for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+
+    async def _listen(self, host: str) -> int:
+        """
+        Accept the connections of the other parties, and return the port listened on.
+        """
+        self.server = await asyncio.start_server(self._receive, host, 0)
+        return self.server.sockets[0].getsockname()[1]
+
+
+    async def _connect(self, peer_id: str, host: str, port: int) -> None:
+        _, writer = await asyncio.open_connection(host, port)
+        write_message(writer, {"type": "hello", "sender": self.client_id, "label": ""})
+        await writer.drain()
+        self.writers[peer_id] = writer
+
+
+    async def _receive(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Store the messages sent by another party in the mailbox.
+        """
+        try:
+            header, _ = await read_message(reader)
+            sender_id = header["sender"]
+            while True:
+                header, body = await read_message(reader)
+                self.metrics.add("messages_received")
+                self.metrics.add("bytes_received", len(body))
+                with self.mailbox_changed:
+                    self.mailbox[(header["type"], sender_id, header["label"])] = body
+                    if header["type"] == "private":
+                        self.private_senders[header["label"]].add(sender_id)
+                    self.mailbox_changed.notify_all()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+    def _send(self, messages: List[Tuple[str, Dict[str, Any], bytes]]) -> None:
+        """
+        Send messages, given as (receiver_id, header, body), to the other parties.
+        """
+        async def _send_all():
+            receivers = set()
+            for receiver_id, header, body in messages:
+                write_message(self.writers[receiver_id], header, body)
+                receivers.add(receiver_id)
+            for receiver_id in receivers:
+                await self.writers[receiver_id].drain()
+
+        with self.metrics.timer("send_time"):
+            self._run(_send_all())
+        for receiver_id, header, body in messages:
+            self.metrics.add("messages_sent", label=header["label"], peer=receiver_id)
+            self.metrics.add("bytes_sent", len(body))
+
+
+    def _wait_mailbox(self, received: Callable[[], bool]) -> None:
+        """
+        Wait until the messages are received, i.e. `received` holds, or raise TimeoutError.
+        Must be called while holding mailbox_changed.
+        """
+        if not self.mailbox_changed.wait_for(received, self.timeout):
+            raise TimeoutError("Messages of the other parties not received")
+
+
+    def _wait_messages(self, keys: List[Tuple[str, str, str]]) -> List[bytes]:
+        """
+        Wait until all the messages with the given keys are received, and take them from the
+        mailbox.
+        """
+        start = time.perf_counter()
+        with self.mailbox_changed:
+            self._wait_mailbox(lambda: all(key in self.mailbox for key in keys))
+            messages = [self.mailbox.pop(key) for key in keys]
+        self._count_wait(keys, time.perf_counter() - start)
+        return messages
+
+
+    def _wait_private_messages(self, labels: List[str]) -> List[bytes]:
+        """
+        Wait until private messages with all the given labels are received, and take them from the
+        mailbox. Raises ValueError if several parties sent a message with the same label.
+        """
+        start = time.perf_counter()
+        keys = []
+        with self.mailbox_changed:
+            self._wait_mailbox(lambda: all(label in self.private_senders for label in labels))
+            for label in labels:
+                senders = self.private_senders.pop(label)
+                if len(senders) > 1:
+                    raise ValueError(f"Private message {label} sent by {', '.join(sorted(senders))}")
+                keys.append(("private", senders.pop(), label))
+            messages = [self.mailbox.pop(key) for key in keys]
+        self._count_wait(keys, time.perf_counter() - start)
+        return messages
+
+
+    def _count_wait(self, keys: List[Tuple[str, str, str]], elapsed: float) -> None:
+        """
+        Record the time waited for messages.
+        """
+        for _, sender_id, label in keys:
+            self.metrics.add("wait_time", elapsed, label, sender_id)
+        self.metrics.add("blocked_time", elapsed)
+
+
+    def send_private_messages(
+            self,
+            receiver_id: str,
+            messages: Dict[str, Union[bytes, str]]
+        ) -> None:
+        """
+        Send several private messages to the same receiver, indexed by label.
+        """
+        self._send([
+            (receiver_id, {"type": "private", "label": _to_str(label)}, _to_bytes(message))
+            for label, message in messages.items()
+        ])
+
+
+    def retrieve_private_messages(
+            self,
+            labels: List[str]
+        ) -> List[bytes]:
+        """
+        Retrieve several private messages sent to this client.
+        """
+        return self._wait_private_messages([_to_str(label) for label in labels])
+
+
+    def publish_message(
+            self,
+            label: str,
+            message: Union[bytes, str]
+        ) -> None:
+        """
+        Send a message to every other party.
+        """
+        header = {"type": "public", "label": _to_str(label)}
+        self._send([(peer_id, header, _to_bytes(message)) for peer_id in self.peer_ids])
+
+
+    def retrieve_public_messages(
+            self,
+            keys: List[Tuple[str, str]]
+        ) -> List[bytes]:
+        """
+        Retrieve several public messages, given as (sender_id, label) pairs.
+        """
+        return self._wait_messages(
+            [("public", sender_id, _to_str(label)) for sender_id, label in keys]
+        )
+
+
+    def retrieve_beaver_triplet_shares(
+            self,
+            op_id: str
+        ) -> Tuple[Share, Share, Share]:
+        """
+        Retrieve a triplet of shares generated by the trusted server.
+        """
+        return self.relay.retrieve_beaver_triplet_shares(op_id)
+
+
+    def retrieve_beaver_triplet_shares_batch(
+            self,
+            op_ids: List[str]
+        ) -> List[Tuple[Share, Share, Share]]:
+        """
+        Retrieve the triplets of shares of several operations from the trusted server.
+        """
+        return self.relay.retrieve_beaver_triplet_shares_batch(op_ids)
+
+
+    def retrieve_beaver_triplet_vectors(
+            self,
+            op_ids: List[str]
+        ) -> Tuple[ShareVector, ShareVector, ShareVector]:
+        """
+        Retrieve the triplets of shares of several operations from the trusted server, as vectors.
+        """
+        return self.relay.retrieve_beaver_triplet_vectors(op_ids)
+
+
+    def leave_session(self) -> None:
+        """
+        Leave the session of this client on the relay server.
+        """
+        self.relay.leave_session()
+
+
+    def close(self) -> None:
+        """
+        Close the connections to the other parties and to the relay server.
+        """
+        async def _close():
+            for writer in self.writers.values():
+                writer.close()
+            if self.server is not None:
+                self.server.close()
+            # Stop receiving, so that no connection handler is left pending in the stopped loop.
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self._run(_close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.relay.close()
@@ -0,0 +1,258 @@
+"""
+Benchmarks of the SMC protocol, run on the real stack: one relay server (server.py) and one
+process per SMCParty, communicating over HTTP.
+
+Each benchmark sweeps one parameter of the computed circuit (number of parties, secrets,
+additions, scalar additions, scalar multiplications, multiplications, or multiplicative depth),
+and every run is done in its own session of a single server. For each run, the results are the
+wall time of the computation, the number of communication rounds, and the messages, requests and
+bytes sent and received by each party, with the time it was blocked waiting for messages and the
+time of its local arithmetic (see SMCParty.metrics). They are printed as JSON, one run per line.
+
+The values and the ids of the secrets are drawn from a generator seeded with --seed and the
+configuration of the run, so that every run is reproducible.
+
+Usage:
+    python3 performance.py [--repeat N] [--port PORT] [--seed SEED] [--output FILE] [BENCHMARK ...]
+"""
+
+import argparse
+import json
+import random
+import socket
+import sys
+import time
+from multiprocessing import Barrier, Process, Queue
+from multiprocessing.synchronize import Barrier as BarrierType
+from typing import Any, Callable, Dict, List, Tuple
+
+from expression import Expression, Scalar, Secret
+from protocol import ProtocolSpec
+from secret_sharing import Share
+from server import run
+from smc_party import SMCParty
+
+
+# A circuit: the expression, the values of the secrets of each party, and the expected result.
+Circuit = Tuple[Expression, Dict[str, Dict[Secret, int]], int]
+
+# Default number of parties of the circuits, when it is not the swept parameter.
+NUM_PARTIES = 3
+
+
+def _parties(num_parties: int) -> List[str]:
+    return [f"party{i}" for i in range(num_parties)]
+
+
+def _secrets(num_parties: int, num_secrets: int) -> Tuple[List[Secret], List[int], Dict[str, Dict[Secret, int]]]:
+    """
+    Secrets with random values, distributed among the parties in turn. The values and the ids of
+    the secrets are drawn from the seeded generator of the random module.
+    """
+    secrets = [Secret() for _ in range(num_secrets)]
+    values = [random.randrange(1000) for _ in range(num_secrets)]
+    value_dicts: Dict[str, Dict[Secret, int]] = {party: {} for party in _parties(num_parties)}
+    for i, (secret, value) in enumerate(zip(secrets, values)):
+        value_dicts[f"party{i % num_parties}"][secret] = value
+    return secrets, values, value_dicts
+
+
+def parties_circuit(num_parties: int) -> Circuit:
+    """Sum of one secret per party."""
+    secrets, values, value_dicts = _secrets(num_parties, num_parties)
+    expr = secrets[0]
+    for secret in secrets[1:]:
+        expr = expr + secret
+    return expr, value_dicts, sum(values)
+
+
+def secrets_circuit(num_secrets: int) -> Circuit:
+    """Sum of secrets."""
+    secrets, values, value_dicts = _secrets(NUM_PARTIES, num_secrets)
+    expr = secrets[0]
+    for secret in secrets[1:]:
+        expr = expr + secret
+    return expr, value_dicts, sum(values)
+
+
+def additions_circuit(num_additions: int) -> Circuit:
+    """Additions of the secrets of the parties."""
+    secrets, values, value_dicts = _secrets(NUM_PARTIES, NUM_PARTIES)
+    expr = secrets[0]
+    for i in range(num_additions):
+        expr = expr + secrets[(i + 1) % NUM_PARTIES]
+    return expr, value_dicts, values[0] + sum(values[(i + 1) % NUM_PARTIES] for i in range(num_additions))
+
+
+def scalar_additions_circuit(num_additions: int) -> Circuit:
+    """Additions of scalars to a secret."""
+    secrets, values, value_dicts = _secrets(NUM_PARTIES, NUM_PARTIES)
+    expr = secrets[0]
+    for i in range(num_additions):
+        expr = expr + Scalar(i)
+    return expr, value_dicts, values[0] + sum(range(num_additions))
+
+
+def scalar_multiplications_circuit(num_multiplications: int) -> Circuit:
+    """Multiplications of a secret by scalars."""
+    secrets, values, value_dicts = _secrets(NUM_PARTIES, NUM_PARTIES)
+    expr = secrets[0]
+    for _ in range(num_multiplications):
+        expr = expr * Scalar(3)
+    return expr, value_dicts, values[0] * 3 ** num_multiplications
+
+
+def multiplications_circuit(num_multiplications: int) -> Circuit:
+    """Sum of products of secrets, all of them in the same layer."""
+    secrets, values, value_dicts = _secrets(NUM_PARTIES, NUM_PARTIES)
+    expr: Expression = Scalar(0)
+    expected = 0
+    for i in range(num_multiplications):
+        a, b = i % NUM_PARTIES, (i + 1) % NUM_PARTIES
+        # The scalar makes every product distinct.
+        expr = expr + secrets[a] * (secrets[b] + Scalar(i))
+        expected += values[a] * (values[b] + i)
+    return expr, value_dicts, expected
+
+
+def depth_circuit(depth: int) -> Circuit:
+    """Chain of multiplications of the given multiplicative depth."""
+    secrets, values, value_dicts = _secrets(NUM_PARTIES, NUM_PARTIES)
+    expr = secrets[0]
+    expected = values[0]
+    for i in range(depth):
+        expr = expr * secrets[(i + 1) % NUM_PARTIES]
+        expected *= values[(i + 1) % NUM_PARTIES]
+    return expr, value_dicts, expected
+
+
+# Circuit and values of the swept parameter of each benchmark.
+BENCHMARKS: Dict[str, Tuple[Callable[[int], Circuit], List[int]]] = {
+    "parties": (parties_circuit, [2, 5, 10, 20]),
+    "secrets": (secrets_circuit, [10, 50, 100, 500]),
+    "additions": (additions_circuit, [10, 100, 1000, 10000]),
+    "scalar_additions": (scalar_additions_circuit, [10, 100, 1000, 10000]),
+    "scalar_multiplications": (scalar_multiplications_circuit, [10, 100, 1000, 10000]),
+    "multiplications": (multiplications_circuit, [10, 50, 100, 500]),
+    "depth": (depth_circuit, [1, 5, 10, 20]),
+}
+
+
+def smc_party(
+        client_id: str,
+        port: int,
+        prot: ProtocolSpec,
+        value_dict: Dict[Secret, int],
+        barrier: BarrierType,
+        queue: Queue
+    ) -> None:
+    """
+    Run a party, and report its result, the times at which it started and finished, and its
+    traffic. The parties start together once all their processes are ready, and the time of a
+    party covers the sharing of its secrets, done when it is built, and its run.
+    """
+    barrier.wait()
+    # The wall clock is comparable between the processes.
+    start = time.time()
+    # Logging every request would dominate the measures.
+    party = SMCParty(
+        client_id, "localhost", port, protocol_spec=prot, value_dict=value_dict, quiet=True
+    )
+    result = party.run()
+    queue.put((client_id, result, start, time.time(), party.metrics.totals))
+
+
+def wait_for_server(port: int, timeout: float = 30.0) -> None:
+    """
+    Wait until the server accepts connections.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection(("localhost", port), timeout=1.0):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def run_benchmark(name: str, parameter: int, port: int, repeat: int, seed: int) -> Dict[str, Any]:
+    """
+    Run a benchmark once with the given value of its parameter.
+    """
+    make_circuit, _ = BENCHMARKS[name]
+    random.seed(f"{seed}-{name}-{parameter}-{repeat}")
+    expr, value_dicts, expected = make_circuit(parameter)
+    participants = list(value_dicts)
+    prot = ProtocolSpec(participants, expr, session_id=f"{name}-{parameter}-{repeat}")
+
+    queue: Queue = Queue()
+    barrier = Barrier(len(participants))
+    parties = [
+        Process(target=smc_party, args=(client_id, port, prot, value_dict, barrier, queue))
+        for client_id, value_dict in value_dicts.items()
+    ]
+    for party in parties:
+        party.start()
+    reports = [queue.get() for _ in parties]
+    for party in parties:
+        party.join()
+
+    num_parties = len(parties)
+    starts = [start for _, _, start, _, _ in reports]
+    ends = [end for _, _, _, end, _ in reports]
+    totals = [t for _, _, _, _, t in reports]
+    return {
+        "benchmark": name,
+        "parameter": parameter,
+        "repeat": repeat,
+        "seed": seed,
+        "parties": num_parties,
+        "correct": all(result == expected % Share.MODULUS for _, result, _, _, _ in reports),
+        "wall_time": max(ends) - min(starts),
+        "party_time": sum(end - start for start, end in zip(starts, ends)) / num_parties,
+        "rounds": int(max(t["rounds"] for t in totals)),
+        # A request may carry many messages, and the p2p transport sends messages without
+        # requests, so both are reported.
+        "messages_per_party": sum(t["messages_sent"] for t in totals) / num_parties,
+        "requests_per_party": sum(t["requests"] for t in totals) / num_parties,
+        "bytes_sent_per_party": sum(t["bytes_sent"] for t in totals) / num_parties,
+        "bytes_received_per_party": sum(t["bytes_received"] for t in totals) / num_parties,
+        "blocked_time_per_party": sum(t["blocked_time"] for t in totals) / num_parties,
+        "compute_time_per_party": sum(t["compute_time"] for t in totals) / num_parties,
+    }
+
+
+def main(args: List[str]) -> None:
+    """
+    Entrypoint of the program.
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks of the SMC protocol.")
+    parser.add_argument("benchmarks", nargs="*", help=f"among {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each configuration")
+    parser.add_argument("--port", type=int, default=5002, help="port of the server")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the values of the secrets")
+    parser.add_argument("--output", help="file to which the results are appended")
+    options = parser.parse_args(args)
+    for name in options.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name}")
+
+    server = Process(target=run, args=("localhost", options.port, [], True), daemon=True)
+    server.start()
+    try:
+        wait_for_server(options.port)
+        output = open(options.output, "a") if options.output else sys.stdout
+        for name in options.benchmarks or list(BENCHMARKS):
+            for parameter in BENCHMARKS[name][1]:
+                for repeat in range(options.repeat):
+                    result = run_benchmark(name, parameter, options.port, repeat, options.seed)
+                    print(json.dumps(result), file=output, flush=True)
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
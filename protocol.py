@@ -1,3 +1,6 @@
+import secrets
+from typing import Optional
+
 from expression import Expression
 
 
@@ -6,9 +9,29 @@ class ProtocolSpec:
 
     Attributes:
         participant_ids: List of IDs of the participating clients
-        expr: Expression to be computed
+        expr: Expression to be computed, if circuit is not given
+        session_id: Session of the computation on the server, so that several computations can
+            share the same server. If None, the default session of the server is used.
+        circuit: Content hash of the compiled expression in the cache of circuits (see
+            compiler.save_program). The parties then load it instead of compiling expr.
+        run_id: Nonce of this run of the computation, prefixed to the labels of its messages and
+            to the ids of its multiplications, so that running the same circuit again on the
+            same server does not reuse them. All the parties must use the same run_id: if None,
+            a random one is drawn, and the parties must share this specification.
     """
 
-    def __init__(self, participant_ids: list, expr: Expression):
+    def __init__(
+            self,
+            participant_ids: list,
+            expr: Optional[Expression] = None,
+            session_id: Optional[str] = None,
+            circuit: Optional[str] = None,
+            run_id: Optional[str] = None
+        ):
+        if expr is None and circuit is None:
+            raise ValueError("Either an expression or a circuit must be given")
         self.participant_ids = participant_ids
         self.expr = expr
+        self.session_id = session_id
+        self.circuit = circuit
+        self.run_id = run_id if run_id is not None else secrets.token_hex(8)
@@ -0,0 +1,315 @@
+"""
+Client communication with the push server, over a persistent TCP connection.
+
+Messages are exchanged as length-prefixed frames: every message is a JSON header frame followed by
+a body frame. Instead of polling, the client keeps its connection open and the server pushes the
+private messages addressed to the client and every published message as soon as they arrive. The
+client stores them in a local mailbox, from which the retrieve_* methods read.
+
+The connection is handled by an asyncio event loop running in a background thread, so that the
+class exposes the same synchronous interface as Communication.
+"""
+
+import asyncio
+import json
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from metrics import Metrics
+from secret_sharing import Share, deserialize_shares
+from transport import Transport
+
+
+FRAME_HEADER = struct.Struct(">I")
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    """
+    Read a length-prefixed frame.
+    """
+    (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    return await reader.readexactly(length)
+
+
+def write_frame(writer: asyncio.StreamWriter, frame: bytes) -> None:
+    """
+    Write a length-prefixed frame.
+    """
+    writer.write(FRAME_HEADER.pack(len(frame)) + frame)
+
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[Dict[str, Any], bytes]:
+    """
+    Read a message, made of a JSON header and a body.
+    """
+    header = json.loads(await read_frame(reader))
+    body = await read_frame(reader)
+    return header, body
+
+
+def write_message(writer: asyncio.StreamWriter, header: Dict[str, Any], body: bytes = b"") -> None:
+    """
+    Write a message, made of a JSON header and a body.
+    """
+    write_frame(writer, json.dumps(header).encode("utf-8"))
+    write_frame(writer, body)
+
+
+def _to_bytes(message: Union[bytes, str]) -> bytes:
+    return message.encode("utf-8") if isinstance(message, str) else message
+
+
+def _to_str(label: Union[bytes, str]) -> str:
+    return label.decode("utf-8") if isinstance(label, bytes) else label
+
+
+class PushCommunication(Transport):
+    """
+    Network communications with the push server.
+
+    Attributes:
+        server_host: hostname of the server
+        server_port: port of the server
+        client_id: Identifier of this client
+        timeout: time to wait for a message before giving up, in seconds (default: 30 s)
+        metrics: messages, bytes, time spent sending and time blocked waiting for messages and
+            for the TTP, per label and peer
+    """
+
+    def __init__(
+            self,
+            server_host: str,
+            server_port: int,
+            client_id: str,
+            timeout: float = 30.0
+    ):
+        self.client_id = client_id
+        self.timeout = timeout
+        self.metrics = Metrics()
+
+        # Messages pushed by the server, indexed by (kind, sender, label).
+        self.mailbox: Dict[Tuple[str, str, str], bytes] = {}
+        self.mailbox_changed = threading.Condition()
+        # Set once the connection to the server is closed, so that no message can arrive anymore.
+        self.disconnected = False
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self._run(self._connect(server_host, server_port))
+
+
+    def _run(self, coroutine):
+        """
+        Run a coroutine in the event loop of the connection and wait for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+
+    async def _connect(self, server_host: str, server_port: int) -> None:
+        reader, self.writer = await asyncio.open_connection(server_host, server_port)
+        write_message(self.writer, {"type": "hello", "client_id": self.client_id})
+        await self.writer.drain()
+        self.loop.create_task(self._receive(reader))
+
+
+    async def _receive(self, reader: asyncio.StreamReader) -> None:
+        """
+        Store the messages pushed by the server in the mailbox.
+        """
+        while True:
+            try:
+                header, body = await read_message(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                with self.mailbox_changed:
+                    self.disconnected = True
+                    self.mailbox_changed.notify_all()
+                return
+            key = (header["type"], header.get("sender", ""), header["label"])
+            self.metrics.add("messages_received")
+            self.metrics.add("bytes_received", len(body))
+            with self.mailbox_changed:
+                self.mailbox[key] = body
+                self.mailbox_changed.notify_all()
+
+
+    async def _send(self, header: Dict[str, Any], body: bytes = b"") -> None:
+        assert self.writer is not None
+        write_message(self.writer, header, body)
+        await self.writer.drain()
+        self.metrics.add("messages_sent", label=header["label"], peer=header.get("receiver"))
+        self.metrics.add("bytes_sent", len(body))
+
+
+    def _wait_mailbox(self, key: Tuple[str, str, str]) -> bytes:
+        """
+        Wait until the server pushed the message with the given key.
+        Raises ConnectionError if the connection is closed before, and TimeoutError if the message
+        does not arrive within the timeout.
+        """
+        with self.mailbox_changed:
+            self.mailbox_changed.wait_for(
+                lambda: key in self.mailbox or self.disconnected, self.timeout
+            )
+            if key in self.mailbox:
+                return self.mailbox[key]
+            if self.disconnected:
+                raise ConnectionError(f"Connection to the push server closed, waiting for {key}")
+            raise TimeoutError(f"Message {key} not received")
+
+
+    def _wait_message(self, key: Tuple[str, str, str]) -> bytes:
+        """
+        Wait until the server pushed the message with the given key, recording the time waited.
+        """
+        _, sender_id, label = key
+        start = time.perf_counter()
+        message = self._wait_mailbox(key)
+        elapsed = time.perf_counter() - start
+        self.metrics.add("wait_time", elapsed, label, sender_id or None)
+        self.metrics.add("blocked_time", elapsed)
+        return message
+
+
+    def send_private_message(
+            self,
+            receiver_id: str,
+            label: str,
+            message: Union[bytes, str]
+        ) -> None:
+        """
+        Send a private message to the server.
+        """
+        header = {"type": "private", "receiver": receiver_id, "label": _to_str(label)}
+        with self.metrics.timer("send_time"):
+            self._run(self._send(header, _to_bytes(message)))
+
+
+    def retrieve_private_message(
+            self,
+            label: str
+        ) -> bytes:
+        """
+        Retrieve a private message pushed by the server.
+        """
+        return self._wait_message(("private", "", _to_str(label)))
+
+
+    def publish_message(
+            self,
+            label: str,
+            message: Union[bytes, str]
+        ) -> None:
+        """
+        Publish a message on the server.
+        """
+        header = {"type": "public", "label": _to_str(label)}
+        with self.metrics.timer("send_time"):
+            self._run(self._send(header, _to_bytes(message)))
+
+
+    def retrieve_public_message(
+            self,
+            sender_id: str,
+            label: str
+        ) -> bytes:
+        """
+        Retrieve a public message pushed by the server.
+        """
+        return self._wait_message(("public", sender_id, _to_str(label)))
+
+
+    def send_private_messages(
+            self,
+            receiver_id: str,
+            messages: Dict[str, Union[bytes, str]]
+        ) -> None:
+        """
+        Send several private messages to the same receiver, indexed by label.
+        """
+        async def _send_all():
+            assert self.writer is not None
+            for label, message in messages.items():
+                header = {"type": "private", "receiver": receiver_id, "label": _to_str(label)}
+                write_message(self.writer, header, _to_bytes(message))
+                self.metrics.add("messages_sent", label=header["label"], peer=receiver_id)
+                self.metrics.add("bytes_sent", len(_to_bytes(message)))
+            await self.writer.drain()
+
+        with self.metrics.timer("send_time"):
+            self._run(_send_all())
+
+
+    def retrieve_private_messages(
+            self,
+            labels: List[str]
+        ) -> List[bytes]:
+        """
+        Retrieve several private messages pushed by the server.
+        """
+        return [self.retrieve_private_message(label) for label in labels]
+
+
+    def retrieve_public_messages(
+            self,
+            keys: List[Tuple[str, str]]
+        ) -> List[bytes]:
+        """
+        Retrieve several public messages, given as (sender_id, label) pairs, pushed by the server.
+        """
+        return [self.retrieve_public_message(sender_id, label) for sender_id, label in keys]
+
+
+    def retrieve_beaver_triplet_shares(
+            self,
+            op_id: str
+        ) -> Tuple[Share, Share, Share]:
+        """
+        Retrieve a triplet of shares generated by the trusted server.
+        """
+        op_id = _to_str(op_id)
+        with self.metrics.timer("ttp_time"):
+            self._run(self._send({"type": "shares", "label": op_id}))
+            message = self._wait_mailbox(("shares", "", op_id))
+        self.metrics.add("triplets")
+        return tuple(deserialize_shares(message)) # type: ignore
+
+
+    def retrieve_beaver_triplet_shares_batch(
+            self,
+            op_ids: List[str]
+        ) -> List[Tuple[Share, Share, Share]]:
+        """
+        Retrieve the triplets of shares of several operations. All the requests are sent before
+        waiting for the answers.
+        """
+        op_ids = [_to_str(op_id) for op_id in op_ids]
+
+        async def _request_all():
+            assert self.writer is not None
+            for op_id in op_ids:
+                write_message(self.writer, {"type": "shares", "label": op_id})
+            await self.writer.drain()
+
+        with self.metrics.timer("ttp_time"):
+            self._run(_request_all())
+            messages = [self._wait_mailbox(("shares", "", op_id)) for op_id in op_ids]
+        self.metrics.add("triplets", len(op_ids))
+        return [tuple(deserialize_shares(message)) for message in messages] # type: ignore
+
+
+    def close(self) -> None:
+        """
+        Close the connection to the server.
+        """
+        async def _close():
+            if self.writer is not None:
+                self.writer.close()
+
+        self._run(_close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
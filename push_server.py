@@ -0,0 +1,149 @@
+"""
+Trusted server pushing messages to the SMC parties over persistent TCP connections.
+This is the counterpart of push_communication.PushCommunication.
+"""
+
+import asyncio
+import sys
+from typing import Any, Dict, List, Set, Tuple
+
+from push_communication import read_message, write_message
+from secret_sharing import serialize_shares
+from ttp import TrustedParamGenerator
+
+
+class PushServer:
+    """
+    Server storing the messages of the parties, and pushing each of them to its recipients as soon
+    as it arrives.
+
+    Attributes:
+        participants: IDs of the participating clients
+    """
+
+    def __init__(self, participants: List[str]):
+        self.ttp = TrustedParamGenerator()
+        for participant in participants:
+            self.ttp.add_participant(participant)
+        self.ttp.start(lazy=True)
+
+        # Messages are only kept until they are pushed to all their recipients.
+        self.private: Dict[Tuple[str, str], bytes] = {}
+        self.public: Dict[Tuple[str, str], bytes] = {}
+        self.public_pending: Dict[Tuple[str, str], Set[str]] = {}
+        self.connections: Dict[str, asyncio.StreamWriter] = {}
+
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serve the connection of a client.
+        """
+        header, _ = await read_message(reader)
+        client_id = header["client_id"]
+        self.connections[client_id] = writer
+        print(f"[ CONNECT  ] CLIENT {client_id}")
+
+        # Catch up with the messages sent before the client connected.
+        for (receiver_id, label), data in list(self.private.items()):
+            if receiver_id == client_id:
+                write_message(writer, {"type": "private", "label": label}, data)
+                del self.private[(receiver_id, label)]
+        for (sender_id, label), data in list(self.public.items()):
+            if client_id in self.public_pending[(sender_id, label)]:
+                write_message(writer, {"type": "public", "sender": sender_id, "label": label}, data)
+                self._public_pushed((sender_id, label), client_id)
+        await writer.drain()
+
+        try:
+            while True:
+                header, body = await read_message(reader)
+                await self.dispatch(client_id, header, body)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if self.connections.get(client_id) is writer:
+                del self.connections[client_id]
+            writer.close()
+
+
+    async def dispatch(self, client_id: str, header: Dict[str, Any], body: bytes) -> None:
+        """
+        Handle a message received from a client.
+        """
+        label = header["label"]
+
+        if header["type"] == "private":
+            receiver_id = header["receiver"]
+            print(f"[ SEND     ] SENDER {client_id} / LABEL {label} / RECEIVER {receiver_id}")
+            if not await self.push(receiver_id, {"type": "private", "label": label}, body):
+                self.private[(receiver_id, label)] = body
+
+        elif header["type"] == "public":
+            print(f"[ PUBLISH  ] SENDER {client_id} / LABEL {label}")
+            key = (client_id, label)
+            pending = self.ttp.participant_ids - {client_id}
+            if not pending:
+                # No other participant to push the message to.
+                return
+            self.public[key] = body
+            self.public_pending[key] = pending
+            for receiver_id in list(pending):
+                if await self.push(
+                    receiver_id, {"type": "public", "sender": client_id, "label": label}, body
+                ):
+                    self._public_pushed(key, receiver_id)
+
+        elif header["type"] == "shares":
+            shares = self.ttp.retrieve_share(client_id, label)
+            await self.push(
+                client_id, {"type": "shares", "label": label}, serialize_shares(shares)
+            )
+
+
+    async def push(self, receiver_id: str, header: Dict[str, Any], body: bytes) -> bool:
+        """
+        Push a message to a client if it is connected, and return whether it was pushed.
+        """
+        writer = self.connections.get(receiver_id)
+        if writer is None:
+            return False
+        write_message(writer, header, body)
+        await writer.drain()
+        return True
+
+
+    def _public_pushed(self, key: Tuple[str, str], receiver_id: str) -> None:
+        """
+        Record that a public message was pushed to a client, and free it once pushed to all.
+        """
+        pending = self.public_pending.get(key)
+        if pending is None:
+            return
+        pending.discard(receiver_id)
+        if not pending:
+            del self.public[key]
+            del self.public_pending[key]
+
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def run(host: str, port: int, participants: List[str]) -> None:
+    """
+    Register the participants, then run the server.
+    """
+    asyncio.run(PushServer(participants).serve(host, port))
+
+
+def main(args: List[str]) -> None:
+    """
+    Entrypoint of the program.
+    """
+    run("localhost", 5000, args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
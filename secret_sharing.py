@@ -4,21 +4,55 @@ Secret sharing scheme.
 
 from __future__ import annotations
 
-from typing import List , Optional
-from random import randint
-import json
+from typing import Any, Iterable, List , Sequence, Union
+import itertools
+import os
+import secrets
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # type: ignore
+
+# Field elements are encoded on a fixed number of bytes, in big-endian order.
+SHARE_BYTES = 32
+# Header of a vector of shares: format version and number of shares.
+VECTOR_HEADER = struct.Struct(">BI")
+VECTOR_VERSION = 1
 
 class Share:
     """
     A secret share in a finite field.
+
+    The arithmetic is reduced lazily: the result of an operation is only reduced modulo MODULUS
+    once it exceeds _LIMIT, so that a long chain of additions costs integer additions only. The
+    value is reduced when it is read, e.g. to serialize or open the share.
     """
 
+    __slots__ = ("_acc",)
+
     #this modulus provides 256 bits of security
     MODULUS = 101855371129257486166347889299578665493313847995829888078830076277971759798433
+    # Bound on the absolute value of an unreduced share: about 2^64 additions of reduced values.
+    _LIMIT = MODULUS << 64
+
+
+    def __init__(self, n :int = 0):
+        self._acc = n % Share.MODULUS
 
+    @staticmethod
+    def _lazy(n: int) -> Share:
+        """Share of a possibly unreduced value, reduced only if it exceeds the limit."""
+        share = Share.__new__(Share)
+        share._acc = n if -Share._LIMIT < n < Share._LIMIT else n % Share.MODULUS
+        return share
 
-    def __init__(self, n :Optional[int] = 0):
-        self._value = n % Share.MODULUS
+    @property
+    def _value(self) -> int:
+        """The reduced value of the share."""
+        self._acc %= Share.MODULUS
+        return self._acc
 
     def __repr__(self):
         # Helps with debugging.
@@ -32,9 +66,9 @@ class Share:
 
     def __add__(self, other):
         if isinstance(other,Share):
-            return Share(self._value + other._value)
+            return Share._lazy(self._acc + other._acc)
         elif isinstance(other,int):
-            return Share(self._value + other)
+            return Share._lazy(self._acc + other)
         else :
             raise NotImplementedError
         
@@ -44,55 +78,319 @@ class Share:
     
     def __sub__(self, other):
         if isinstance(other,Share):
-            return Share(self._value - other._value)
+            return Share._lazy(self._acc - other._acc)
         elif isinstance(other,int):
-            return Share(self._value - other)
+            return Share._lazy(self._acc - other)
         else :
             raise NotImplementedError
         
     def __rsub__(self, other):
-        s = self.__sub__(other)
-        return Share(- s._value)
+        if isinstance(other,int):
+            return Share._lazy(other - self._acc)
+        else :
+            raise NotImplementedError
 
     def __mul__(self, other):
         if isinstance(other,Share):
-            return Share(self._value * other._value)
+            return Share._lazy(self._acc * other._acc)
         elif isinstance(other,int):
-            return Share(self._value * other)
+            return Share._lazy(self._acc * other)
         else :
             raise NotImplementedError
         
     def __rmul__(self, other):
         return self.__mul__(other)
 
-    def serialize(self):
+    def serialize(self) -> bytes:
         """Generate a representation suitable for passing in a message."""
-        return json.dumps({'value': self._value})
+        return self._value.to_bytes(SHARE_BYTES, "big")
         
 
     @staticmethod
-    def deserialize(serialized) -> Share:
+    def deserialize(serialized: bytes) -> Share:
         """Restore object from its serialized representation."""
-        deserialized = json.loads(serialized)
-        return Share(deserialized['value'])
+        if len(serialized) != SHARE_BYTES:
+            raise ValueError("Invalid share encoding")
+        return Share(int.from_bytes(serialized, "big"))
 
 
-def share_secret(secret: int, num_shares: int) -> List[Share]:
-    """Generate secret shares."""
-    
-    shares = [Share()]
+# Prime moduli of the supported fields. Smaller fields trade security for faster arithmetic: their
+# elements fit in a machine word, so vectors of shares are computed with NumPy.
+DEFAULT_MODULUS = Share.MODULUS
+MERSENNE_61 = 2**61 - 1
+PRIME_31 = 2**31 - 1
+
+
+def set_modulus(modulus: int) -> None:
+    """
+    Set the prime modulus of the field of the shares. All the parties and the trusted third party
+    must use the same field.
+    """
+    global SHARE_BYTES
+    Share.MODULUS = modulus
+    Share._LIMIT = modulus << 64
+    SHARE_BYTES = (modulus.bit_length() + 7) // 8
+
+
+def _vectorised() -> bool:
+    """
+    Whether vectors of shares are stored in NumPy arrays: NumPy must be installed, and the product
+    of two field elements must be computable on 64-bit words.
+    """
+    return np is not None and (Share.MODULUS < 2**32 or Share.MODULUS == MERSENNE_61)
+
+
+def _mul_mod(a, b):
+    """
+    Element-wise product modulo the modulus of two uint64 arrays of reduced field elements.
+    """
+    p = np.uint64(Share.MODULUS)
+    if Share.MODULUS < 2**32:
+        return (a * b) % p
+
+    # Modulo 2^61 - 1: the operands are split in 32-bit halves, and 2^61 = 1, so that no
+    # intermediate result exceeds 64 bits.
+    shift_29, shift_32, shift_61 = np.uint64(29), np.uint64(32), np.uint64(61)
+    mask_32 = np.uint64(2**32 - 1)
+    a_hi, a_lo = a >> shift_32, a & mask_32
+    b_hi, b_lo = b >> shift_32, b & mask_32
+    # a * b = hi * 2^64 + mid * 2^32 + lo, and 2^64 = 8.
+    hi = (a_hi * b_hi) << np.uint64(3)
+    mid = a_hi * b_lo + a_lo * b_hi
+    lo = a_lo * b_lo
+    r = hi + (mid >> shift_29) + ((mid & np.uint64(2**29 - 1)) << shift_32)
+    r += (lo & p) + (lo >> shift_61)
+    r = (r & p) + (r >> shift_61)
+    return np.where(r >= p, r - p, r)
+
+
+class ShareVector:
+    """
+    A vector of secret shares, on which the arithmetic is element-wise.
+
+    The values are stored in a NumPy uint64 array when the field allows it (see _vectorised), and
+    in a list of Python ints otherwise.
+    """
+
+    __slots__ = ("_values",)
+
+    # NumPy uint64 array, or list of ints.
+    _values: Any
 
-    for _ in range(num_shares-1):
-        share_i = Share(randint(0, Share.MODULUS))
-        shares.append(share_i)
+    def __init__(self, values: Iterable[int] = ()):
+        if not _vectorised():
+            self._values = [int(v) % Share.MODULUS for v in values]
+        elif np is not None and isinstance(values, np.ndarray):
+            # An array of non-negative integers is reduced without going through Python ints.
+            self._values = values.astype(np.uint64) % np.uint64(Share.MODULUS)
+        else:
+            self._values = np.array([v % Share.MODULUS for v in values], dtype=np.uint64)
 
-    shares[0] = Share(secret) - sum(shares)
-    return shares
+    @staticmethod
+    def _wrap(values) -> ShareVector:
+        vector = ShareVector.__new__(ShareVector)
+        vector._values = values
+        return vector
+
+    @staticmethod
+    def from_shares(shares: Sequence[Share]) -> ShareVector:
+        if not _vectorised():
+            return ShareVector._wrap([share._value for share in shares])
+        return ShareVector._wrap(
+            np.fromiter((share._value for share in shares), dtype=np.uint64, count=len(shares))
+        )
+
+    def to_shares(self) -> List[Share]:
+        return [Share(int(v)) for v in self._values]
+
+    def __repr__(self):
+        return "ShareVector({})".format(list(self))
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return (int(v) for v in self._values)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return ShareVector._wrap(self._values[i])
+        return Share(int(self._values[i]))
+
+    def take(self, indices: Sequence[int]) -> ShareVector:
+        """Vector of the elements at the given indices."""
+        if isinstance(self._values, list):
+            return ShareVector._wrap([self._values[i] for i in indices])
+        return ShareVector._wrap(self._values[np.asarray(indices, dtype=np.intp)])
+
+    def sum(self) -> int:
+        """Sum of the elements, in the field."""
+        if isinstance(self._values, list):
+            return sum(self._values) % Share.MODULUS
+        # The halves of the 64-bit words are summed separately, so that no sum of fewer than 2^32
+        # elements overflows.
+        shift_32 = np.uint64(32)
+        hi = int((self._values >> shift_32).sum(dtype=np.uint64))
+        lo = int((self._values & np.uint64(2**32 - 1)).sum(dtype=np.uint64))
+        return ((hi << 32) + lo) % Share.MODULUS
+
+    def _operand(self, other):
+        """Values of the other operand, with the same representation and length as this vector."""
+        if isinstance(other, ShareVector):
+            if len(other) != len(self):
+                raise ValueError("Vectors of different lengths")
+            return other._values
+        elif isinstance(other, (int, Share)):
+            value = int(other) % Share.MODULUS
+            if isinstance(self._values, list):
+                return itertools.repeat(value)
+            return np.full(len(self), value, dtype=np.uint64)
+        else :
+            raise NotImplementedError
+
+    def __add__(self, other):
+        a, b = self._values, self._operand(other)
+        if isinstance(a, list):
+            return ShareVector._wrap([(x + y) % Share.MODULUS for x, y in zip(a, b)])
+        return ShareVector._wrap((a + b) % np.uint64(Share.MODULUS))
+
+    def __radd__(self, other):
+        return self.__add__(other)
+
+    def __sub__(self, other):
+        a, b = self._values, self._operand(other)
+        if isinstance(a, list):
+            return ShareVector._wrap([(x - y) % Share.MODULUS for x, y in zip(a, b)])
+        p = np.uint64(Share.MODULUS)
+        return ShareVector._wrap((a + (p - b)) % p)
+
+    def __rsub__(self, other):
+        return self * -1 + other
+
+    def __mul__(self, other):
+        a, b = self._values, self._operand(other)
+        if isinstance(a, list):
+            return ShareVector._wrap([(x * y) % Share.MODULUS for x, y in zip(a, b)])
+        return ShareVector._wrap(_mul_mod(a, b))
+
+    def __rmul__(self, other):
+        return self.__mul__(other)
+
+    def concat(self, other: ShareVector) -> ShareVector:
+        """Concatenation of two vectors."""
+        if isinstance(self._values, list):
+            return ShareVector._wrap(self._values + list(other._values))
+        return ShareVector._wrap(np.concatenate([self._values, other._values]))
+
+    def serialize(self) -> bytes:
+        """Generate a representation suitable for passing in a message, as serialize_shares."""
+        header = VECTOR_HEADER.pack(VECTOR_VERSION, len(self))
+        if isinstance(self._values, list):
+            return header + b"".join(v.to_bytes(SHARE_BYTES, "big") for v in self._values)
+        # Big-endian 64-bit words, truncated to SHARE_BYTES bytes.
+        words = np.frombuffer(self._values.astype(">u8").tobytes(), dtype=np.uint8)
+        return header + words.reshape(-1, 8)[:, 8 - SHARE_BYTES:].tobytes()
+
+    @staticmethod
+    def deserialize(serialized: bytes) -> ShareVector:
+        """Restore a vector from its serialized representation."""
+        version, count = VECTOR_HEADER.unpack_from(serialized)
+        if version != VECTOR_VERSION or len(serialized) != VECTOR_HEADER.size + count * SHARE_BYTES:
+            raise ValueError("Invalid share vector encoding")
+        if not _vectorised():
+            return ShareVector(
+                int.from_bytes(serialized[i:i + SHARE_BYTES], "big")
+                for i in range(VECTOR_HEADER.size, len(serialized), SHARE_BYTES)
+            )
+        data = np.frombuffer(serialized, dtype=np.uint8, offset=VECTOR_HEADER.size)
+        words = np.zeros((count, 8), dtype=np.uint8)
+        words[:, 8 - SHARE_BYTES:] = data.reshape(count, SHARE_BYTES)
+        values = np.frombuffer(words.tobytes(), dtype=">u8").astype(np.uint64)
+        return ShareVector._wrap(values % np.uint64(Share.MODULUS))
+
+
+def serialize_shares(shares: Sequence[Share]) -> bytes:
+    """Generate a representation of a list of shares suitable for passing in a single message."""
+    header = VECTOR_HEADER.pack(VECTOR_VERSION, len(shares))
+    return header + b"".join(share._value.to_bytes(SHARE_BYTES, "big") for share in shares)
+
+
+def deserialize_shares(serialized: bytes) -> List[Share]:
+    """Restore a list of shares from its serialized representation."""
+    version, count = VECTOR_HEADER.unpack_from(serialized)
+    if version != VECTOR_VERSION or len(serialized) != VECTOR_HEADER.size + count * SHARE_BYTES:
+        raise ValueError("Invalid share vector encoding")
+    return [
+        Share(int.from_bytes(serialized[i:i + SHARE_BYTES], "big"))
+        for i in range(VECTOR_HEADER.size, len(serialized), SHARE_BYTES)
+    ]
+
+
+def _reduce_words(hi, lo):
+    """
+    Element-wise value modulo the modulus of hi * 2^64 + lo, for two uint64 arrays.
+    """
+    p = np.uint64(Share.MODULUS)
+    hi, lo = hi % p, lo % p
+    return (_mul_mod(hi, np.full_like(hi, 2**64 % Share.MODULUS)) + lo) % p
+
+
+def random_field_elements(count: int) -> List[int]:
+    """
+    Draw uniformly random field elements from the system CSPRNG.
+    The random bytes of all the elements are drawn at once. Each element is reduced from 64 bits
+    more than the modulus, which makes the bias of the reduction negligible.
+    """
+    size = SHARE_BYTES + 8
+    data = secrets.token_bytes(count * size)
+    return [
+        int.from_bytes(data[i:i + size], "big") % Share.MODULUS
+        for i in range(0, count * size, size)
+    ]
+
+
+def random_field_vector(count: int) -> ShareVector:
+    """
+    Vector of uniformly random field elements, drawn as random_field_elements. In the fields
+    stored in NumPy arrays, each element is reduced from 128 random bits without Python ints.
+    """
+    if not _vectorised():
+        return ShareVector._wrap(random_field_elements(count))
+    words = np.frombuffer(secrets.token_bytes(count * 16), dtype=">u8").astype(np.uint64)
+    words = words.reshape(count, 2)
+    return ShareVector._wrap(_reduce_words(words[:, 0], words[:, 1]))
+
+
+def share_secret(secret: int, num_shares: int) -> List[Share]:
+    """Generate secret shares."""
+    return [vector[0] for vector in share_vector([secret], num_shares)]
 
 
 def reconstruct_secret(shares: List[Share]) -> int:
     """Reconstruct the secret from shares."""
-    return sum(shares)._value
+    return ShareVector.from_shares(shares).sum()
+
+
+def share_vector(values: Union[List[int], ShareVector], num_shares: int) -> List[ShareVector]:
+    """Generate secret shares of several values at once, as one vector per participant."""
+    first = values if isinstance(values, ShareVector) else ShareVector(values)
+    random_vectors = [random_field_vector(len(first)) for _ in range(num_shares - 1)]
+    for vector in random_vectors:
+        first = first - vector
+    return [first] + random_vectors
+
+
+def reconstruct_vector(vectors: List[ShareVector]) -> List[int]:
+    """Reconstruct several secrets from the vectors of shares of all the participants."""
+    total = vectors[0]
+    for vector in vectors[1:]:
+        total = total + vector
+    return list(total)
+
+
+# The field can be chosen for all the processes of a computation from the environment.
+if "SMC_MODULUS" in os.environ:
+    set_modulus(int(os.environ["SMC_MODULUS"]))
 
 
 
@@ -4,107 +4,485 @@ You should not need to change this file.
 """
 
 import collections
+import functools
+import math
 import sys
-from typing import Dict, List, Optional, Tuple
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
 
-from flask import Flask, request, Response, jsonify
+from flask import Flask, abort, g, jsonify, request, Response
+from werkzeug.serving import WSGIRequestHandler, make_server
 
+from communication import decode_batch, decode_keys, encode_batch
+from metrics import Metrics
+from secret_sharing import serialize_shares
 from ttp import TrustedParamGenerator
 
 
+# A channel is identified by its session, a participant and a label.
+Channel = Tuple[str, str, str]
+
 app: Flask = Flask("Trusted Third Party Server")
-store: Dict[str, Dict[Tuple[str, str], bytes]] = collections.defaultdict(dict)
-ttp: TrustedParamGenerator = TrustedParamGenerator()
+# Values are kept in insertion order, so that the oldest ones are evicted first.
+store: Dict[str, Dict[Channel, bytes]] = collections.defaultdict(collections.OrderedDict)
+# Number of retrievals left before each value is evicted (None if unknown), and time at which
+# each value was stored.
+readers_left: Dict[str, Dict[Channel, Optional[int]]] = collections.defaultdict(dict)
+stored_at: Dict[str, Dict[Channel, float]] = collections.defaultdict(dict)
+# Each computation runs in its own session, with its own participants and TTP. The routes without
+# a session prefix use the default session, whose participants are given to run().
+DEFAULT_SESSION = ""
+sessions: Dict[str, TrustedParamGenerator] = {DEFAULT_SESSION: TrustedParamGenerator()}
+# Participants which left each session. A session is torn down once all of them left.
+sessions_left: Dict[str, Set[str]] = collections.defaultdict(set)
+sessions_lock = threading.Lock()
+# Notified every time a value is stored, to wake up the long-polling requests.
+store_changed = threading.Condition()
+# If set, the server does not log the requests.
+quiet: bool = False
+# Requests, bytes and time of the requests per route, and time waited for the messages per pool.
+metrics = Metrics()
+# Number of retrieval requests held until their messages arrive.
+waiting = 0
+
+# Upper bound on the time a retrieval request may be held, in seconds.
+MAX_WAIT = 30.0
+# Values which are not retrieved by all their readers are evicted after MAX_AGE seconds, or
+# when a pool holds more than MAX_ENTRIES values.
+MAX_AGE = 600.0
+MAX_ENTRIES = 1_000_000
+
+
+def session_route(rule: str, **options):
+    """
+    Register a route both for the default session, and under the prefix of a given session.
+    The view receives the session id as `session_id`. Requests to a session which was not opened
+    get a 410 error, distinct from the 404 of a message not stored yet, so that no message is
+    stored for it and the clients waiting for its messages give up.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def session_view(session_id: str, **kwargs):
+            if session_id not in sessions:
+                abort(410)
+            return view(session_id=session_id, **kwargs)
+
+        app.add_url_rule(
+            rule, view_func=session_view, defaults={"session_id": DEFAULT_SESSION}, **options
+        )
+        app.add_url_rule(f"/sessions/<session_id>{rule}", view_func=session_view, **options)
+        return view
+    return decorator
+
+
+@app.before_request
+def _start_request():
+    g.start = time.perf_counter()
+
+
+@app.after_request
+def _count_request(response: Response) -> Response:
+    """
+    Count the traffic and the time of a request, per route.
+    """
+    route = request.endpoint or "unknown"
+    metrics.add("requests", label=route)
+    metrics.add("bytes_received", request.content_length or 0, label=route)
+    metrics.add("bytes_sent", response.calculate_content_length() or 0, label=route)
+    metrics.add("request_time", time.perf_counter() - g.start, label=route)
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    The client get the metrics of the server, with the current sizes of the store and of the TTP
+    of each session.
+    """
+    summary = metrics.summary()
+    with store_changed:
+        summary["store"] = {pool: len(values) for pool, values in store.items()}
+        summary["waiting_requests"] = waiting
+    summary["sessions"] = {
+        session_id: {
+            "participants": len(session_ttp.participant_ids),
+            "pool": len(session_ttp.pool),
+            "pending_ops": len(session_ttp.remaining),
+            "pool_misses": session_ttp.pool_misses,
+        }
+        for session_id, session_ttp in list(sessions.items())
+    }
+    return jsonify(summary)
+
+
+@app.route("/sessions/<session_id>", methods=["POST"])
+def open_session(session_id: str):
+    """
+    The client open a session, given the list of its participants.
+    Opening an existing session with the same participants has no effect.
+    """
+    participants = set(decode_keys(request.get_data()))
+    with sessions_lock:
+        if session_id in sessions:
+            if sessions[session_id].participant_ids != participants:
+                return Response(status=409)
+            return Response(status=200)
+        session_ttp = TrustedParamGenerator()
+        for participant in participants:
+            session_ttp.add_participant(participant)
+        session_ttp.start(lazy=True)
+        sessions[session_id] = session_ttp
+    _log(f"[ OPEN     ] SESSION {session_id} / {len(participants)} PARTICIPANTS")
+    return Response(status=200)
+
+
+@app.route("/sessions/<session_id>/<client_id>", methods=["DELETE"])
+def leave_session(session_id: str, client_id: str):
+    """
+    The client leave a session. Once all the participants left, the session is torn down: its
+    TTP and its remaining messages are freed.
+    """
+    with sessions_lock:
+        session_ttp = _session_ttp(session_id)
+        sessions_left[session_id].add(client_id)
+        if not session_ttp.participant_ids <= sessions_left[session_id]:
+            return Response(status=200)
+        del sessions[session_id]
+        del sessions_left[session_id]
+    session_ttp.stop()
+    _close_channels(session_id)
+    _log(f"[ CLOSE    ] SESSION {session_id}")
+    return Response(status=200)
 
 
-@app.route("/private/<sender_id>/<receiver_id>/<label>", methods=["POST"])
-def send_private_message(sender_id: str, receiver_id: str, label: str):
+@session_route("/private/<sender_id>/<receiver_id>/<label>", methods=["POST"])
+def send_private_message(session_id: str, sender_id: str, receiver_id: str, label: str):
     """
     The client send a private message to the server.
     """
-    print(
+    _log(
         f"[ SEND     ] SENDER {sender_id} / LABEL {label} / RECEIVER {receiver_id}"
     )
-    _set_value("private", (receiver_id, label), request.get_data())
+    _set_value("private", (session_id, receiver_id, label), request.get_data(), 1)
     return Response(status=200)
 
 
-@app.route("/private/<receiver_id>/<label>", methods=["GET"])
-def retrieve_private_message(receiver_id: str, label: str):
+@session_route("/private/<receiver_id>/<label>", methods=["GET"])
+def retrieve_private_message(session_id: str, receiver_id: str, label: str):
     """
     The client retrieve a private message from the server.
+    If the `wait` query parameter is given, the request is held for up to that many seconds
+    until the message arrives.
     """
-    res = _get_value("private", (receiver_id, label))
+    res = _wait_value("private", (session_id, receiver_id, label), _wait_param())
     if res is not None:
-        print(f"[ RETRIEVE ] RECEIVER {receiver_id} / LABEL {label}")
+        _log(f"[ RETRIEVE ] RECEIVER {receiver_id} / LABEL {label}")
         return res, 200
 
     return Response(status=404)
 
 
-@app.route("/public/<sender_id>/<label>", methods=["POST"])
-def publish_message(sender_id: str, label: str):
+@session_route("/public/<sender_id>/<label>", methods=["POST"])
+def publish_message(session_id: str, sender_id: str, label: str):
     """
     The client publish a public message on the server.
     """
-    print(f"[ PUBLISH  ] SENDER {sender_id} / LABEL {label}")
-    _set_value("public", (sender_id, label), request.get_data())
+    _log(f"[ PUBLISH  ] SENDER {sender_id} / LABEL {label}")
+    readers = _num_readers(session_id, sender_id)
+    _set_value("public", (session_id, sender_id, label), request.get_data(), readers)
     return Response(status=200)
 
 
-@app.route("/public/<receiver_id>/<sender_id>/<label>", methods=["GET"])
-def retrieve_public_message(receiver_id: str, sender_id: str, label: str):
+@session_route("/public/<receiver_id>/<sender_id>/<label>", methods=["GET"])
+def retrieve_public_message(session_id: str, receiver_id: str, sender_id: str, label: str):
     """
     The client retrieve a public message from the server.
+    If the `wait` query parameter is given, the request is held for up to that many seconds
+    until the message arrives.
     """
-    res = _get_value("public", (sender_id, label))
+    res = _wait_value("public", (session_id, sender_id, label), _wait_param())
     if res is not None:
-        print(
+        _log(
             f"[ RETRIEVE ] RECEIVER {receiver_id}. LABEL {label} / SENDER {sender_id}"
         )
         return res, 200
     return Response(status=404)
 
 
-@app.route("/shares/<client_id>/<op_id>", methods=["GET"])
-def retrieve_share(client_id: str, op_id: str):
+@session_route("/batch/private/<sender_id>/<receiver_id>", methods=["POST"])
+def send_private_messages(session_id: str, sender_id: str, receiver_id: str):
+    """
+    The client send several private messages, indexed by label, to the same receiver.
+    """
+    messages = decode_batch(request.get_data())
+    _log(
+        f"[ SEND     ] SENDER {sender_id} / {len(messages)} LABELS / RECEIVER {receiver_id}"
+    )
+    values = {(session_id, receiver_id, label): data for label, data in messages.items()}
+    _set_values("private", values, 1)
+    return Response(status=200)
+
+
+@session_route("/batch/private/<receiver_id>", methods=["POST"])
+def retrieve_private_messages(session_id: str, receiver_id: str):
+    """
+    The client retrieve several private messages, given by the list of their labels.
+    The messages which are available are returned, indexed by label. If the `wait` query
+    parameter is given, the request is held for up to that many seconds until all of them arrive.
+    """
+    labels = decode_keys(request.get_data())
+    channels = {label: (session_id, receiver_id, label) for label in labels}
+    res = _wait_values("private", channels, _wait_param())
+    _log(f"[ RETRIEVE ] RECEIVER {receiver_id} / {len(res)} LABELS")
+    return Response(encode_batch(res), status=200, mimetype="application/octet-stream")
+
+
+@session_route("/batch/public/<receiver_id>", methods=["POST"])
+def retrieve_public_messages(session_id: str, receiver_id: str):
+    """
+    The client retrieve several public messages, given by a list of "<sender_id>/<label>" keys.
+    The messages which are available are returned, indexed by key. If the `wait` query
+    parameter is given, the request is held for up to that many seconds until all of them arrive.
+    """
+    channels: Dict[str, Channel] = {}
+    for key in decode_keys(request.get_data()):
+        sender_id, label = key.split("/", 1)
+        channels[key] = (session_id, sender_id, label)
+    res = _wait_values("public", channels, _wait_param())
+    _log(f"[ RETRIEVE ] RECEIVER {receiver_id} / {len(res)} LABELS")
+    return Response(encode_batch(res), status=200, mimetype="application/octet-stream")
+
+
+@session_route("/shares/<client_id>/<op_id>", methods=["GET"])
+def retrieve_share(session_id: str, client_id: str, op_id: str):
     """
     The client retrieve Beaver triplets generated by the server.
     """
-    shares = ttp.retrieve_share(client_id, op_id)
-    return jsonify([share.serialize() for share in shares]), 200
+    shares = _session_ttp(session_id).retrieve_share(client_id, op_id)
+    return Response(serialize_shares(shares), status=200, mimetype="application/octet-stream")
+
+
+@session_route("/batch/shares/<client_id>", methods=["POST"])
+def retrieve_shares(session_id: str, client_id: str):
+    """
+    The client retrieve the Beaver triplets of several operations, given by the list of their ids.
+    The shares of all the triplets are returned in a single vector.
+    """
+    op_ids = decode_keys(request.get_data())
+    triplets = _session_ttp(session_id).retrieve_shares(client_id, op_ids)
+    shares = [share for triplet in triplets for share in triplet]
+    return Response(serialize_shares(shares), status=200, mimetype="application/octet-stream")
 
 
-def _set_value(pool: str, channel: Tuple[str, str], data: bytes) -> None:
+def _set_value(pool: str, channel: Channel, data: bytes, readers: Optional[int]) -> None:
     """
     Push data to a channel in a given pool and send an event.
+    The data is evicted once it has been retrieved `readers` times.
     """
-    store[pool][channel] = data
+    _set_values(pool, {channel: data}, readers)
 
 
-def _get_value(pool: str, channel: Tuple[str, str]) -> Optional[bytes]:
+def _set_values(pool: str, values: Dict[Channel, bytes], readers: Optional[int]) -> None:
+    """
+    Push data to several channels in a given pool and send a single event.
+    Each value is evicted once it has been retrieved `readers` times.
+    """
+    now = time.monotonic()
+    with store_changed:
+        for channel, data in values.items():
+            store[pool][channel] = data
+            store[pool].move_to_end(channel) # type: ignore
+            readers_left[pool][channel] = readers
+            stored_at[pool][channel] = now
+        _evict_stale(pool, now)
+        store_changed.notify_all()
+
+
+def _get_value(pool: str, channel: Channel) -> Optional[bytes]:
     """
     Subscribe to a channel in a given pool and get it once ready.
     """
-    if channel not in store[pool]:
-        return None
-    return store[pool][channel]
+    with store_changed:
+        return store[pool].get(channel)
 
 
-def run(host: str, port: int, participants: List[str]) -> None:
+def _wait_value(pool: str, channel: Channel, timeout: float) -> Optional[bytes]:
+    """
+    Get the data of a channel in a given pool, waiting up to `timeout` seconds for it.
+    The retrieval counts as a read of the data.
+    """
+    global waiting
+    start = time.perf_counter()
+    with store_changed:
+        waiting += 1
+        store_changed.wait_for(lambda: channel in store[pool], timeout)
+        waiting -= 1
+        res = _get_value(pool, channel)
+        if res is not None:
+            _consume(pool, channel)
+    metrics.add("wait_time", time.perf_counter() - start, label=pool)
+    return res
+
+
+def _wait_values(
+        pool: str,
+        channels: Dict[str, Channel],
+        timeout: float
+    ) -> Dict[str, bytes]:
+    """
+    Get the data of several channels in a given pool, waiting up to `timeout` seconds for all of
+    them. Only the channels which are available are returned, with the same keys as `channels`.
+    The retrieval counts as a read of the data returned.
+    """
+    global waiting
+    start = time.perf_counter()
+    with store_changed:
+        waiting += 1
+        store_changed.wait_for(
+            lambda: all(channel in store[pool] for channel in channels.values()), timeout
+        )
+        waiting -= 1
+        res = {
+            key: store[pool][channel] for key, channel in channels.items() if channel in store[pool]
+        }
+        for key in res:
+            _consume(pool, channels[key])
+    metrics.add("wait_time", time.perf_counter() - start, label=pool)
+    return res
+
+
+def _session_ttp(session_id: str) -> TrustedParamGenerator:
+    """
+    TTP of a session, or a 410 error if the session does not exist.
+    """
+    session_ttp = sessions.get(session_id)
+    if session_ttp is None:
+        abort(410)
+    return session_ttp
+
+
+def _num_readers(session_id: str, sender_id: str) -> Optional[int]:
+    """
+    Number of participants expected to retrieve a public message, None if unknown.
+    """
+    readers = len(_session_ttp(session_id).participant_ids - {sender_id})
+    return readers if readers > 0 else None
+
+
+def _consume(pool: str, channel: Channel) -> None:
+    """
+    Count a read of a channel, and evict its data once all its readers retrieved it.
+    Must be called while holding store_changed.
+    """
+    left = readers_left[pool].get(channel)
+    if left is None:
+        return
+    if left > 1:
+        readers_left[pool][channel] = left - 1
+    else:
+        _evict(pool, channel)
+
+
+def _evict(pool: str, channel: Channel) -> None:
+    """
+    Remove the data of a channel.
+    Must be called while holding store_changed.
+    """
+    store[pool].pop(channel, None)
+    readers_left[pool].pop(channel, None)
+    stored_at[pool].pop(channel, None)
+
+
+def _close_channels(session_id: str) -> None:
+    """
+    Evict all the values of a session.
+    """
+    with store_changed:
+        for pool in list(store):
+            for channel in [c for c in store[pool] if c[0] == session_id]:
+                _evict(pool, channel)
+
+
+def _evict_stale(pool: str, now: float) -> None:
+    """
+    Evict the oldest values of a pool, while they are older than MAX_AGE or the pool holds more
+    than MAX_ENTRIES values.
+    Must be called while holding store_changed.
+    """
+    values = store[pool]
+    while values:
+        oldest = next(iter(values))
+        if len(values) <= MAX_ENTRIES and now - stored_at[pool][oldest] <= MAX_AGE:
+            break
+        _evict(pool, oldest)
+
+
+def _wait_param() -> float:
+    """
+    Read the time the client accepts to wait for a message, in seconds, clamped to
+    [0, MAX_WAIT]. A value which is not a finite number is rejected with a 400 error.
+    """
+    try:
+        wait = float(request.args.get("wait", 0))
+    except ValueError:
+        abort(400)
+    if not math.isfinite(wait):
+        abort(400)
+    return min(max(wait, 0.0), MAX_WAIT)
+
+
+def _log(message: str) -> None:
+    """
+    Log a request, unless the server is quiet.
+    """
+    if not quiet:
+        print(message)
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """
+    Request handler speaking HTTP/1.1, which keeps the connections of the clients alive between
+    requests.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+
+class QuietRequestHandler(KeepAliveRequestHandler):
+    """
+    Request handler which does not log the requests.
+    """
+
+    def log_request(self, *args, **kwargs) -> None:
+        pass
+
+
+def run(host: str, port: int, participants: List[str], quiet_mode: bool = False) -> None:
     """
     Register the participants, then run the server.
+    Each connection is served by its own thread. In quiet mode, the requests are not logged.
     """
+    global quiet
+    quiet = quiet_mode
+
+    ttp = sessions[DEFAULT_SESSION]
     for participant in participants:
         ttp.add_participant(participant)
-    app.run(host, port, debug=True, threaded=False, processes=1, use_reloader=False)
+    ttp.start(lazy=True)
+
+    handler = QuietRequestHandler if quiet else KeepAliveRequestHandler
+    server = make_server(host, port, app, threaded=True, request_handler=handler)
+    _log(f"Serving on http://{host}:{port}")
+    server.serve_forever()
 
 
 def main(args: List[str]) -> None:
     """
     Entrypoint of the program.
     """
-    run("localhost", 5000, args)
+    quiet_mode = "--quiet" in args
+    run("localhost", 5000, [arg for arg in args if arg != "--quiet"], quiet_mode)
 
 
 if __name__ == "__main__":
@@ -7,24 +7,46 @@ MODIFY THIS FILE.
 
 import collections
 import json
+import time
 from expression import *
 from typing import (
+    Any,
     Dict,
+    List,
+    Optional,
     Set,
     Tuple,
     Union
 )
 
 from communication import Communication
+from compiler import (
+    ADD,
+    ADDK,
+    CONST,
+    LINEAR,
+    MULT,
+    MULTK,
+    OPEN,
+    SECRET,
+    SUB,
+    Program,
+    compile_circuit,
+    load_program,
+)
 from expression import (
     Expression,
-    Secret
+    Secret,
 )
+from p2p_communication import PeerCommunication
 from protocol import ProtocolSpec
+from push_communication import PushCommunication
+from transport import Transport
 from secret_sharing import(
     reconstruct_secret,
-    share_secret,
+    share_vector,
     Share,
+    ShareVector,
 )
 
 # Feel free to add as many imports as you want.
@@ -41,6 +63,20 @@ class SMCParty:
         server_port: port of the server
         protocol_spec (ProtocolSpec): Protocol specification
         value_dict (dict): Dictionary assigning values to secrets belonging to this client.
+        transport: "http" to communicate through the HTTP server (server.py), "push" to use a
+            persistent connection to the push server (push_server.py), "p2p" to send the shares
+            directly to the other parties, the HTTP server being only used for discovery and the
+            Beaver triplets (p2p_communication.py), or a Transport instance,
+            e.g. a memory_transport.MemoryTransport for parties running in the same process.
+        metrics_file: File to which the metrics of the communications and of the phases of the
+            computation are written as JSON at the end of run, if given. The metrics include the
+            number of rounds, i.e. of exchanges in which the party waits for the messages of the
+            others.
+        listen_host: with transport="p2p", hostname on which this client accepts the connections
+            of the other parties. It is published to them, so it must be reachable by all of them,
+            e.g. the address of this machine when the parties run on several machines.
+        quiet: if set, the requests to the HTTP server are not logged, as with the --quiet option
+            of the server
     """
 
     def __init__(
@@ -49,38 +85,90 @@ class SMCParty:
             server_host: str,
             server_port: int,
             protocol_spec: ProtocolSpec,
-            value_dict: Dict[Secret, int]
+            value_dict: Dict[Secret, int],
+            transport: Union[str, Transport] = "http",
+            metrics_file: Optional[str] = None,
+            listen_host: str = "localhost",
+            quiet: bool = False
         ):
-        self.comm = Communication(server_host, server_port, client_id)
+        session_id = protocol_spec.session_id
+        self.comm: Transport
+        if isinstance(transport, Transport):
+            self.comm = transport
+        elif transport == "push":
+            if session_id is not None:
+                raise ValueError("Sessions are not supported by the push transport")
+            self.comm = PushCommunication(server_host, server_port, client_id)
+        elif transport == "p2p":
+            self.comm = PeerCommunication(
+                server_host, server_port, client_id, protocol_spec.participant_ids, session_id,
+                run_id=protocol_spec.run_id, host=listen_host, quiet=quiet
+            )
+        elif transport == "http":
+            self.comm = Communication(
+                server_host, server_port, client_id, session_id=session_id, quiet=quiet
+            )
+            if session_id is not None:
+                self.comm.open_session(protocol_spec.participant_ids)
+        else:
+            raise ValueError(f"Unknown transport {transport}")
 
         self.client_id = client_id
         self.protocol_spec = protocol_spec
         self.value_dict = value_dict
+        self.metrics = self.comm.metrics
+        self.metrics_file = metrics_file
 
         self.is_first_party = (min(self.protocol_spec.participant_ids) == self.client_id)
+        self.run_id = protocol_spec.run_id
         self.local_shares = self.share_secrets()
+        # Vectors of the shares of a, b and c of the Beaver triplets of the multiplications, and
+        # index of the triplet of each op id in the vectors.
+        self.triplets: Tuple[ShareVector, ShareVector, ShareVector] = (
+            ShareVector(), ShareVector(), ShareVector()
+        )
+        self.triplet_index: Dict[int, int] = {}
+        # Prefix of the labels of the openings, set once the program is loaded.
+        self.label = ""
 
 
 
-    def share_secrets(self) -> Dict[str,Share]:
-        num_participants = len(self.protocol_spec.participant_ids)
-        local_shares = {} 
-        
-        for key,value in self.value_dict.items():
-            shares = share_secret(value, num_participants)
+    def share_secrets(self) -> Dict[int, Share]:
+        participant_ids = self.protocol_spec.participant_ids
+        local_shares: Dict[int, Share] = {}
+        # Messages to send to each participant, indexed by label.
+        messages: Dict[str, Dict[str, Union[bytes, str]]] = {}
 
-            shares_and_ids = zip(shares, self.protocol_spec.participant_ids)
+        # All the secrets of this party are shared at once, in one vector per participant.
+        secret_ids = [key.id for key in self.value_dict]
+        vectors = share_vector(list(self.value_dict.values()), len(participant_ids))
+
+        for vector, id in zip(vectors, participant_ids):
+            shares = zip(secret_ids, vector.to_shares())
+            if id == self.client_id:
+                local_shares.update(shares)
+            else:
+                messages[id] = {
+                    self.scoped(secret_id): share.serialize() for secret_id, share in shares
+                }
 
-            for share, id in shares_and_ids:
-                if id == self.client_id:
-                    local_shares[key.id] = share
-                else:
-                    self.comm.send_private_message(id, key.id, share.serialize())
+        # A single request per participant.
+        for id, shares_of_id in messages.items():
+            self.comm.send_private_messages(id, shares_of_id)
         
         return local_shares
-    
 
-    def send_and_reconstruct_share(self, local_share, shr_id : str = None):
+
+    def scoped(self, label: Union[str, int]) -> str:
+        """
+        Label of a message or id of a multiplication, scoped to this run of the computation.
+        The labels and ids of a program are fixed, e.g. when it is loaded from the cache of
+        circuits, so they are prefixed with the run id to be unique on the server.
+        """
+        return f"{self.run_id}_{label}"
+
+
+    def send_and_reconstruct_share(self, local_share, shr_id : str):
         """
         Method to send the local share of a value to the server and reconstruct the value from the other participant's shares.
         """
@@ -92,87 +180,173 @@ class SMCParty:
         self.comm.publish_message(label, to_send)
 
         shares = [local_share]
-        # Retrieve other shares
-        for pid in [pid for pid in self.protocol_spec.participant_ids if pid != self.client_id]:
-            pid_share = Share.deserialize(self.comm.retrieve_public_message(pid,label))
-            shares.append(pid_share)
+        # Retrieve other shares, in a single request
+        keys = [(pid, label) for pid in self.protocol_spec.participant_ids if pid != self.client_id]
+        self.metrics.add("rounds")
+        for message in self.comm.retrieve_public_messages(keys):
+            shares.append(Share.deserialize(message))
 
         return reconstruct_secret(shares)
 
 
 
+    def send_and_reconstruct_shares(self, local_shares: ShareVector, label : str) -> ShareVector:
+        """
+        Batched version of send_and_reconstruct_share: publish a vector of local shares in a
+        single message and reconstruct every value from the other participant's vectors.
+        """
+        self.comm.publish_message(label, local_shares.serialize())
+
+        values = local_shares
+        keys = [(pid, label) for pid in self.protocol_spec.participant_ids if pid != self.client_id]
+        self.metrics.add("rounds")
+        for message in self.comm.retrieve_public_messages(keys):
+            values = values + ShareVector.deserialize(message)
+
+        return values
+
+
     def run(self) -> int:
         """
         The method the client use to do the SMC.
         """
 
-        expr = self.protocol_spec.expr
-        local_share = self.process_expression(expr)
-        return self.send_and_reconstruct_share(local_share,expr.id.decode("utf-8"))
+        with self.metrics.timer("compile_time"):
+            if self.protocol_spec.circuit is not None:
+                program = load_program(self.protocol_spec.circuit)
+            else:
+                # ProtocolSpec requires an expression when no circuit is given.
+                assert self.protocol_spec.expr is not None
+                program = compile_circuit(self.protocol_spec.expr)
+        self.label = self.scoped(program.label)
 
+        with self.metrics.timer("preprocess_time"):
+            self.preprocess(program)
 
-    def process_expression(
-            self,
-            expr: Expression
-        ):
+        # The time of the local arithmetic is the time of the evaluation, without the time spent
+        # communicating.
+        waits = ("blocked_time", "send_time", "ttp_time")
+        waited = sum(self.metrics.totals[name] for name in waits)
+        start = time.perf_counter()
+        local_share = self.execute(program)
+        elapsed = time.perf_counter() - start
+        self.metrics.add("execute_time", elapsed)
+        self.metrics.add(
+            "compute_time", elapsed - (sum(self.metrics.totals[name] for name in waits) - waited)
+        )
 
-        p = self.process_expression
-        
-        if isinstance(expr, AddOp):
-            return p(expr.a) + p(expr.b)
-        
-        elif isinstance(expr,AddKOp):
-            k2 = p(expr.a)
-            if self.is_first_party:
-                k = Share(expr.b.value)
-            else:
-                k = Share()
-            if isinstance(expr.a, Scalar):
-                if self.is_first_party:
-                    k2 = Share(expr.a.value)
-                else:
-                    k2 = Share()
-                
-            return k + k2
-        
-        elif isinstance(expr,SubOp):
-            return p(expr.a)-p(expr.b)
-        
-        elif isinstance(expr,MultOp):
-            return self.beaver(expr)
-        
-        elif isinstance(expr, MultKOp):
-            mult = Share()
-            if self.is_first_party or not isinstance(expr.a, Scalar):
-                mult = p(expr.a) * p(expr.b)
-            return mult
-        
-        elif isinstance(expr,Scalar):
-            return Share(expr.value)
-        
-        elif isinstance(expr,Secret):
-            if expr.id not in self.local_shares.keys():
-                share = Share.deserialize(self.comm.retrieve_private_message(expr.id))
-                self.local_shares[expr.id] = share
-            return self.local_shares[expr.id]
+        with self.metrics.timer("output_time"):
+            result = self.send_and_reconstruct_share(local_share, self.label)
+        if self.protocol_spec.session_id is not None:
+            self.comm.leave_session()
+        self.export_metrics()
+        return result
 
 
-    def beaver(self,mult_expr):
+    def export_metrics(self) -> Dict[str, Any]:
         """
-        Function that implements the beaver triplet generation protocol
+        Summary of the metrics of this client, written as JSON to metrics_file if given.
         """
-        #first we get [a], [b], [c] from the trusted third party
-        (a,b,c) = self.comm.retrieve_beaver_triplet_shares(mult_expr.id)
+        summary = self.metrics.summary()
+        summary["client_id"] = self.client_id
+        if self.metrics_file is not None:
+            with open(self.metrics_file, "w") as f:
+                json.dump(summary, f, indent=2, sort_keys=True)
+        return summary
 
-        #We need [x] and [y], mult_expr.a and mult_expr.b, but we need to process them in case they are not leaves
-        x = self.process_expression(mult_expr.a)
-        y = self.process_expression(mult_expr.b)
-        
-        #We share [d] = [x-a] and retrieve d = (x-a) from the published shares
-        d = Share(self.send_and_reconstruct_share(x-a, mult_expr.id.decode("utf-8") + "_d" ))
-        #We share [e] = [y-b] and retrieve e = (y-b) from the other parties
-        e = Share(self.send_and_reconstruct_share(y-b, mult_expr.id.decode("utf-8") + "_e"))
-        
-        #We compute [z] = [c] + [x]*e + [y]*d - (ed if first party, 0 otherwise)
 
-        return c + x * e + y * d - (e * d if self.is_first_party else Share(0))
+    def preprocess(self, program: Program) -> None:
+        """
+        Offline phase: retrieve the Beaver triplets of all the multiplications of the program from
+        the trusted third party, in a single request. They are kept as vectors, from which the
+        triplets of each layer of multiplications are gathered.
+        """
+        op_ids = [op_id for op_id in program.op_ids.values() if op_id not in self.triplet_index]
+        if op_ids:
+            offset = len(self.triplets[0])
+            triplets = self.comm.retrieve_beaver_triplet_vectors(
+                [self.scoped(op_id) for op_id in op_ids]
+            )
+            a, b, c = (old.concat(new) for old, new in zip(self.triplets, triplets))
+            self.triplets = (a, b, c)
+            self.triplet_index.update((op_id, offset + i) for i, op_id in enumerate(op_ids))
+
+
+    def execute(self, program: Program) -> Share:
+        """
+        Evaluate a compiled expression on the local shares, and return the share of its value.
+        """
+        # The triplets are retrieved during preprocessing, unless execute is called on its own.
+        self.preprocess(program)
+        registers: List[Share] = [None] * program.num_registers # type: ignore
+        pending = []
+
+        # Retrieve the shares of the secrets of the other participants in a single request.
+        labels = [
+            a for op, _, a, _ in program.instructions
+            if op == SECRET and a not in self.local_shares
+        ]
+        if labels:
+            self.metrics.add("rounds")
+            messages = self.comm.retrieve_private_messages([self.scoped(label) for label in labels])
+            for label, message in zip(labels, messages):
+                self.local_shares[label] = Share.deserialize(message)
+
+        for op, dest, a, b in program.instructions:
+            if op == ADD:
+                registers[dest] = registers[a] + registers[b]
+
+            elif op == ADDK:
+                registers[dest] = registers[a] + b if self.is_first_party else registers[a]
+
+            elif op == SUB:
+                registers[dest] = registers[a] - registers[b]
+
+            elif op == MULTK:
+                registers[dest] = registers[a] * b
+
+            elif op == LINEAR:
+                # Single reduction for the whole linear combination.
+                value = sum(int(registers[reg]) * k for reg, k in a)
+                registers[dest] = Share(value + b if self.is_first_party else value)
+
+            elif op == CONST:
+                registers[dest] = Share(a) if self.is_first_party else Share()
+
+            elif op == SECRET:
+                registers[dest] = self.local_shares[a]
+
+            elif op == MULT:
+                #[a], [b], [c] from the trusted third party, retrieved during preprocessing
+                index = self.triplet_index[program.op_ids[dest]]
+                pending.append((dest, registers[a], registers[b], index))
+
+            elif op == OPEN:
+                self.beaver(pending, registers, dest)
+                pending = []
+
+        return registers[program.output]
+
+
+    def beaver(self, pending, registers: List[Share], depth: int) -> None:
+        """
+        Function that implements the beaver triplet multiplication protocol, for all the
+        multiplications of a given depth at once.
+        """
+        #The operands and triplets of all the multiplications are processed as vectors
+        x = ShareVector.from_shares([x for _, x, _, _ in pending])
+        y = ShareVector.from_shares([y for _, _, y, _ in pending])
+        indices = [index for _, _, _, index in pending]
+        a, b, c = (vector.take(indices) for vector in self.triplets)
+
+        #We share [d] = [x-a] and [e] = [y-b] for every multiplication in a single message
+        label = self.label + f"_depth{depth}"
+        values = self.send_and_reconstruct_shares((x - a).concat(y - b), label)
+        d, e = values[:len(pending)], values[len(pending):]
+
+        #We compute [z] = [c] + [x]*e + [y]*d - (ed if first party, 0 otherwise)
+        z = c + x * e + y * d
+        if self.is_first_party:
+            z = z - e * d
+        for (dest, _, _, _), share in zip(pending, z.to_shares()):
+            registers[dest] = share
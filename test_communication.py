@@ -0,0 +1,54 @@
+"""
+Tests of the HTTP communication of a party with the relay server.
+"""
+
+import time
+from multiprocessing import Process
+
+import pytest
+import requests
+
+from communication import Communication
+from server import run
+
+
+@pytest.fixture
+def server():
+    process = Process(target=run, args=("localhost", 5003, ["Alice", "Bob"], True))
+    process.start()
+    time.sleep(1)
+    yield
+    process.terminate()
+    process.join()
+
+
+def test_unknown_session_raises(server):
+    comm = Communication("localhost", 5003, "Alice", session_id="typo", timeout=5)
+    try:
+        with pytest.raises(requests.HTTPError):
+            comm.send_private_messages("Bob", {"label": b"share"})
+        with pytest.raises(requests.HTTPError):
+            comm.retrieve_private_messages(["label"])
+        with pytest.raises(requests.HTTPError):
+            comm.retrieve_public_message("Bob", "label")
+    finally:
+        comm.close()
+
+
+def test_missing_message_times_out(server):
+    comm = Communication("localhost", 5003, "Alice", wait_timeout=0.1, timeout=0.3)
+    try:
+        with pytest.raises(TimeoutError):
+            comm.retrieve_private_messages(["label"])
+        with pytest.raises(TimeoutError):
+            comm.retrieve_public_message("Bob", "label")
+    finally:
+        comm.close()
+
+
+def test_quiet(server, capsys):
+    for quiet in (False, True):
+        comm = Communication("localhost", 5003, "Alice", quiet=quiet)
+        comm.send_private_messages("Bob", {"label": b"share"})
+        comm.close()
+        assert bool(capsys.readouterr().out) != quiet
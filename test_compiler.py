@@ -0,0 +1,144 @@
+"""
+Unit tests for the expression compiler.
+"""
+
+import pytest
+
+from compiler import (
+    ADD,
+    ADDK,
+    CONST,
+    LINEAR,
+    MULT,
+    MULTK,
+    OPEN,
+    SECRET,
+    compile_circuit,
+    compile_expression,
+    load_program,
+    save_program,
+)
+from expression import MultOp, Scalar, Secret, linearize
+
+
+def test_compile_linear():
+    a = Secret()
+    b = Secret()
+    program = compile_expression((a + b) * Scalar(3) + Scalar(2))
+
+    assert [op for op, _, _, _ in program.instructions] == [SECRET, SECRET, ADD, MULTK, ADDK]
+    assert program.num_registers == 5
+    assert program.output == 4
+    assert program.op_ids == {}
+
+
+def test_compile_scalars():
+    program = compile_expression(Scalar(5) * Scalar(3))
+
+    assert [op for op, _, _, _ in program.instructions] == [CONST, MULTK]
+    assert program.instructions[0][2] * program.instructions[1][3] == 15
+
+
+def test_compile_layers():
+    a = Secret()
+    b = Secret()
+    c = Secret()
+    ab = a * b
+    expr = ab * c + b * c
+
+    program = compile_expression(expr)
+    ops = [op for op, _, _, _ in program.instructions]
+
+    # a*b and b*c are opened together, (a*b)*c in a second round.
+    assert ops == [SECRET, SECRET, SECRET, MULT, MULT, OPEN, MULT, OPEN, ADD]
+    assert program.instructions[5][1] == 1
+    assert program.instructions[7][1] == 2
+    assert set(program.op_ids.values()) == {ab.id, expr.a.id, expr.b.id}
+
+
+def test_compile_operands_before_use():
+    a = Secret()
+    b = Secret()
+    expr = (a * b + Scalar(1)) * (a - b) * a
+
+    program = compile_expression(expr)
+    defined = set()
+    for op, dest, x, y in program.instructions:
+        if op in (ADD, MULT):
+            assert x in defined and y in defined
+        if op != OPEN:
+            defined.add(dest)
+    assert program.output in defined
+
+
+def test_compile_shared_subexpression():
+    a = Secret()
+    b = Secret()
+    ab = a * b
+    expr = (ab + Scalar(1)) * ab - ab
+
+    program = compile_expression(expr)
+    ops = [op for op, _, _, _ in program.instructions]
+
+    assert ops.count(MULT) == 2
+    assert ops.count(OPEN) == 2
+    assert program.num_registers == 6
+
+
+def test_compile_same_id():
+    a = Secret()
+    b = Secret()
+    left = a * b
+    right = MultOp(a, b, id=left.id)
+
+    program = compile_expression(left + right)
+    ops = [op for op, _, _, _ in program.instructions]
+
+    assert ops == [SECRET, SECRET, MULT, OPEN, ADD]
+
+
+def test_compile_deep_chain():
+    secrets = [Secret() for _ in range(100000)]
+    expr = Scalar(0)
+    for secret in secrets:
+        expr += secret
+    expr *= secrets[0]
+
+    program = compile_expression(expr)
+    ops = [op for op, _, _, _ in program.instructions]
+
+    assert ops.count(SECRET) == len(secrets)
+    assert ops.count(ADD) == len(secrets) - 1
+    assert ops[-2:] == [MULT, OPEN]
+    assert program.output == program.num_registers - 1
+
+
+def test_compile_linear_op():
+    a = Secret()
+    b = Secret()
+    program = compile_expression(linearize((a + b) * Scalar(3) - b + Scalar(2)))
+
+    assert [op for op, _, _, _ in program.instructions] == [SECRET, SECRET, LINEAR]
+    _, _, terms, constant = program.instructions[2]
+    assert terms == [(0, 3), (1, 2)]
+    assert constant == 2
+
+
+def test_circuit_cache(tmp_path):
+    a = Secret()
+    b = Secret()
+    expr = a * b * Scalar(2) + a
+    program = compile_circuit(expr)
+
+    digest = save_program(program, str(tmp_path))
+    assert save_program(compile_circuit(expr), str(tmp_path)) == digest
+
+    loaded = load_program(digest, str(tmp_path))
+    assert loaded.instructions == program.instructions
+    assert loaded.op_ids == program.op_ids
+    assert loaded.label == expr.id
+
+    (tmp_path / f"{digest}.circuit").write_bytes(b"corrupted")
+    load_program.cache_clear()
+    with pytest.raises(ValueError):
+        load_program(digest, str(tmp_path))
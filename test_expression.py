@@ -5,7 +5,19 @@ Testing expressions is not obligatory.
 MODIFY THIS FILE.
 """
 
-from expression import Secret, Scalar
+import pickle
+
+from expression import (
+    AddKOp,
+    AddOp,
+    LinearOp,
+    MultKOp,
+    MultOp,
+    Scalar,
+    Secret,
+    linearize,
+    simplify,
+)
 
 
 # Example test, you can adapt it to your needs.
@@ -17,3 +29,122 @@ def test_expr_construction():
     #assert repr(expr) == "((Secret(1) + Secret(2)) * Secret(3) * Scalar(4) + Scalar(3))"
 
 
+
+
+def test_simplify_scalars():
+    expr = simplify(Scalar(15) + Scalar(15) * Scalar(3) - Scalar(2))
+    assert isinstance(expr, Scalar)
+    assert expr.value == 15 + 15 * 3 - 2
+
+
+def test_simplify_identities():
+    a = Secret()
+    b = Secret()
+
+    assert simplify(Scalar(0) + a) is a
+    assert simplify(a * Scalar(1)) is a
+    assert simplify(a - Scalar(0)) is a
+    zero = simplify(a * b * Scalar(0))
+    assert isinstance(zero, Scalar) and zero.value == 0
+
+
+def test_simplify_constants():
+    a = Secret()
+    b = Secret()
+
+    expr = simplify(a * Scalar(2) * Scalar(3))
+    assert isinstance(expr, MultKOp) and expr.a is a and expr.b.value == 6
+
+    expr = simplify((a + Scalar(2)) + (b + Scalar(3)) - Scalar(1))
+    assert isinstance(expr, AddKOp) and expr.b.value == 4
+    assert isinstance(expr.a, AddOp) and (expr.a.a, expr.a.b) == (a, b)
+
+    expr = simplify((a + Scalar(2)) * Scalar(3))
+    assert isinstance(expr, AddKOp) and expr.b.value == 6
+    assert isinstance(expr.a, MultKOp) and expr.a.b.value == 3
+
+
+def test_simplify_keeps_ids():
+    a = Secret()
+    b = Secret()
+    expr = (Scalar(0) + a) * (b + Scalar(2)) + Scalar(1)
+
+    simplified = simplify(expr)
+    assert simplified.id == expr.id
+    assert isinstance(simplified.a, MultOp) and simplified.a.id == expr.a.id
+    assert simplify(expr).a.b.id == simplified.a.b.id
+
+
+def test_linearize_chain():
+    secrets = [Secret() for _ in range(10)]
+    expr = Scalar(0)
+    for secret in secrets:
+        expr += secret * Scalar(2) - Scalar(1)
+
+    linear = linearize(expr)
+    assert isinstance(linear, LinearOp)
+    assert linear.id == expr.id
+    assert linear.terms == [(secret, 2) for secret in secrets]
+    assert linear.constant == -10
+
+
+def test_linearize_regions():
+    a = Secret()
+    b = Secret()
+    c = Secret()
+    shared = a - b
+    expr = (shared * c + shared) * Scalar(3)
+
+    linear = linearize(expr)
+    assert isinstance(linear, LinearOp)
+    mult, region = [term for term, _ in linear.terms]
+    assert [k for _, k in linear.terms] == [3, 3]
+    assert isinstance(mult, MultOp) and mult.a is region
+    assert isinstance(region, LinearOp) and region.id == shared.id
+    assert region.terms == [(a, 1), (b, -1)]
+
+
+def test_nodes_are_slotted():
+    a = Secret()
+    expr = LinearOp([(a * a + Scalar(1), 2)], 3)
+    for node in [a, Scalar(1), a + a, a * a, a * Scalar(2), expr]:
+        assert not hasattr(node, "__dict__")
+
+
+def test_structural_ids():
+    a = Secret()
+    b = Secret()
+
+    assert a.id != Secret().id
+    assert Scalar(3) is Scalar(3)
+    assert hash(Scalar(3)) == hash(Scalar(3).id)
+    assert (a + b) * Scalar(2) is (a + b) * Scalar(2)
+    assert (a + b).id != (b + a).id
+    assert (a - b).id != (a * b).id
+    assert LinearOp([(a, 2)], 1).id != LinearOp([(a, 1)], 2).id
+
+
+def test_explicit_ids_not_interned():
+    a = Secret()
+    b = Secret()
+    node = AddOp(a, b, 42)
+
+    assert node.id == 42
+    assert AddOp(a, b) is not node
+
+
+def test_scalars_interned_by_value():
+    values = [-1, -2, 0, 1, 2**61 - 1, 2**61, 2**256]
+    assert all(Scalar(v) is Scalar(v) for v in values)
+    assert len({Scalar(v).id for v in values}) == len(values)
+
+
+def test_pickled_nodes_keep_their_ids():
+    a = Secret()
+    b = Secret()
+    expr = LinearOp([(a * b + Scalar(2), 3)], 1) - b
+    loaded = pickle.loads(pickle.dumps(expr))
+
+    assert loaded.id == expr.id
+    assert loaded.a.terms[0][0].a.a.id == a.id
+    assert isinstance(loaded.a.terms[0][0].b, Scalar) and loaded.a.terms[0][0].b.value == 2
@@ -9,6 +9,7 @@ from multiprocessing import Process, Queue
 
 import pytest
 
+from compiler import compile_circuit, save_program
 from expression import Scalar, Secret
 from manif import Manif
 from secret_sharing import Share
@@ -33,15 +34,32 @@ def smc_client(client_id, prot, value_dict, queue):
     print(f"{client_id} has finished!")
 
 
+def smc_client_runs(client_id, prots, value_dict, queue):
+    """
+    Run several computations in sequence, and return all their results.
+    """
+    results = []
+    for prot in prots:
+        cli = SMCParty(
+            client_id,
+            "localhost",
+            5000,
+            protocol_spec=prot,
+            value_dict=value_dict
+        )
+        results.append(cli.run())
+    queue.put(results)
+
+
 def smc_server(args):
     run("localhost", 5000, args)
 
 
-def run_processes(server_args, *client_args):
+def run_processes(server_args, *client_args, client=smc_client):
     queue = Queue()
 
     server = Process(target=smc_server, args=(server_args,))
-    clients = [Process(target=smc_client, args=(*args, queue)) for args in client_args]
+    clients = [Process(target=client, args=(*args, queue)) for args in client_args]
 
     server.start()
     time.sleep(3)
@@ -346,3 +364,84 @@ def test_manif():
 
 
 
+
+
+def test_mult_depth():
+    """
+    f(a, b, c) = (a ∗ b) ∗ (b ∗ c) + (c ∗ a) ∗ K
+    """
+    alice_secret = Secret()
+    bob_secret = Secret()
+    charlie_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: 3},
+        "Bob": {bob_secret: 14},
+        "Charlie": {charlie_secret: 2}
+    }
+
+    expr = (
+        (alice_secret * bob_secret) * (bob_secret * charlie_secret) +
+        (charlie_secret * alice_secret) * Scalar(4)
+    )
+    expected = (3 * 14) * (14 * 2) + (2 * 3) * 4
+    suite(parties, expr, expected)
+
+
+def test_concurrent_sessions():
+    """
+    Two computations between the same parties, run at the same time on one server.
+    """
+    alice_secret = Secret()
+    bob_secret = Secret()
+
+    sum_prot = ProtocolSpec(
+        expr=alice_secret + bob_secret, participant_ids=["Alice", "Bob"], session_id="sum"
+    )
+    product_prot = ProtocolSpec(
+        expr=alice_secret * bob_secret, participant_ids=["Alice", "Bob"], session_id="product"
+    )
+    values = {"Alice": {alice_secret: 6}, "Bob": {bob_secret: 7}}
+
+    results = run_processes(
+        [],
+        *[(name, sum_prot, value_dict) for name, value_dict in values.items()],
+        *[(name, product_prot, value_dict) for name, value_dict in values.items()]
+    )
+    assert sorted(results) == [13, 13, 42, 42]
+
+
+def test_cached_circuit():
+    """
+    The parties load the compiled circuit from the cache instead of compiling the expression.
+    """
+    alice_secret = Secret()
+    bob_secret = Secret()
+    digest = save_program(compile_circuit(alice_secret * bob_secret + Scalar(1)))
+
+    prot = ProtocolSpec(participant_ids=["Alice", "Bob"], circuit=digest)
+    results = run_processes(
+        ["Alice", "Bob"],
+        ("Alice", prot, {alice_secret: 6}),
+        ("Bob", prot, {bob_secret: 7})
+    )
+    assert results == [43, 43]
+
+
+def test_cached_circuit_run_twice():
+    """
+    The same cached circuit is run twice on one server: every run uses its own labels and
+    multiplications.
+    """
+    alice_secret = Secret(1)
+    bob_secret = Secret(2)
+    digest = save_program(compile_circuit(alice_secret * bob_secret + Scalar(1)))
+
+    prots = [ProtocolSpec(participant_ids=["Alice", "Bob"], circuit=digest) for _ in range(2)]
+    results = run_processes(
+        ["Alice", "Bob"],
+        ("Alice", prots, {alice_secret: 6}),
+        ("Bob", prots, {bob_secret: 7}),
+        client=smc_client_runs
+    )
+    assert results == [[43, 43], [43, 43]]
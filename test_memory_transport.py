@@ -0,0 +1,76 @@
+"""
+Tests of the protocol with many parties running as threads, over the in-memory transport.
+"""
+
+import threading
+from random import randint
+
+import pytest
+
+from expression import Scalar, Secret
+from memory_transport import MemoryHub
+from protocol import ProtocolSpec
+from smc_party import SMCParty
+from transport import Transport
+
+
+def run_threads(hub, prot, value_dicts):
+    participants = hub.participant_ids
+    results = {}
+
+    def run_party(client_id):
+        party = SMCParty(
+            client_id, "", 0, prot, value_dicts[client_id], transport=hub.transport(client_id)
+        )
+        results[client_id] = party.run()
+
+    threads = [threading.Thread(target=run_party, args=(client_id,)) for client_id in participants]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [results[client_id] for client_id in participants]
+
+
+def test_many_parties():
+    participants = [f"party{i}" for i in range(100)]
+    secrets = [Secret() for _ in participants]
+    values = [randint(0, 1000) for _ in participants]
+
+    expr = secrets[0] * secrets[1] * Scalar(2)
+    for secret in secrets:
+        expr = expr + secret
+    expected = values[0] * values[1] * 2 + sum(values)
+
+    prot = ProtocolSpec(participants, expr)
+    value_dicts = {
+        client_id: {secret: value} for client_id, secret, value in zip(participants, secrets, values)
+    }
+    hub = MemoryHub(participants)
+    assert run_threads(hub, prot, value_dicts) == [expected] * len(participants)
+
+
+def test_messages_freed():
+    participants = ["Alice", "Bob", "Charlie"]
+    a, b, c = Secret(), Secret(), Secret()
+    prot = ProtocolSpec(participants, (a + b) * c)
+    value_dicts = {"Alice": {a: 3}, "Bob": {b: 4}, "Charlie": {c: 5}}
+
+    hub = MemoryHub(participants)
+    assert run_threads(hub, prot, value_dicts) == [35] * 3
+    assert hub.messages == {}
+
+
+def test_missing_message_times_out():
+    hub = MemoryHub(["Alice", "Bob"], timeout=0.1)
+    with pytest.raises(TimeoutError):
+        hub.transport("Alice").retrieve_public_messages([("Bob", "label")])
+
+
+def test_incomplete_transport():
+    class SendOnly(Transport):
+        def send_private_messages(self, receiver_id, messages):
+            pass
+
+    with pytest.raises(TypeError):
+        SendOnly()
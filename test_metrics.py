@@ -0,0 +1,22 @@
+"""
+Unit tests for the metrics.
+"""
+
+import json
+
+from metrics import Metrics
+
+
+def test_metrics():
+    metrics = Metrics()
+    metrics.add("requests", label="a", peer="Alice")
+    metrics.add("requests", label="b")
+    metrics.add("bytes_sent", 10, peer="Alice")
+    with metrics.timer("wait_time", label="a"):
+        pass
+
+    summary = json.loads(metrics.to_json())
+    assert summary["totals"]["requests"] == 2
+    assert summary["by_label"]["a"]["requests"] == 1
+    assert summary["by_peer"]["Alice"] == {"requests": 1, "bytes_sent": 10}
+    assert summary["by_label"]["a"]["wait_time"] >= 0
@@ -0,0 +1,173 @@
+"""
+Integration tests running the protocol over direct connections between the parties.
+"""
+
+import threading
+import time
+from multiprocessing import Process, Queue
+
+import pytest
+
+from expression import Scalar, Secret
+from communication import Communication
+from manif import Manif
+from p2p_communication import ADDRESS_LABEL, PeerCommunication
+from protocol import ProtocolSpec
+from server import run
+from smc_party import SMCParty
+
+
+def smc_client(client_id, prot, value_dict, queue):
+    cli = SMCParty(
+        client_id,
+        "localhost",
+        5004,
+        protocol_spec=prot,
+        value_dict=value_dict,
+        transport="p2p"
+    )
+    res = cli.run()
+    messages = cli.metrics.totals["messages_sent"]
+    requests = cli.metrics.totals["requests"]
+    cli.comm.close()
+    queue.put((res, messages, requests))
+
+
+def smc_server(args):
+    run("localhost", 5004, args)
+
+
+def suite(parties, expr, expected, session_id=None):
+    participants = list(parties.keys())
+    prot = ProtocolSpec(expr=expr, participant_ids=participants, session_id=session_id)
+    queue = Queue()
+
+    server = Process(target=smc_server, args=([] if session_id else participants,))
+    clients = [
+        Process(target=smc_client, args=(name, prot, value_dict, queue))
+        for name, value_dict in parties.items()
+    ]
+
+    server.start()
+    time.sleep(1)
+    for client in clients:
+        client.start()
+    results = [queue.get() for _ in clients]
+    for client in clients:
+        client.join()
+
+    server.terminate()
+    server.join()
+
+    for result, messages, requests in results:
+        assert result == expected
+        # Only the discovery and the triplets go through the server.
+        assert requests < messages
+
+
+def test_p2p_arithmetic():
+    """
+    f(a, b, c) = ((a + K0) + b ∗ K1 - c) ∗ (b ∗ c)
+    """
+    alice_secret = Secret()
+    bob_secret = Secret()
+    charlie_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: 3},
+        "Bob": {bob_secret: 14},
+        "Charlie": {charlie_secret: 2}
+    }
+
+    expr = ((alice_secret + Scalar(8)) + bob_secret * Scalar(9) - charlie_secret) * (bob_secret * charlie_secret)
+    expected = ((3 + 8) + 14 * 9 - 2) * (14 * 2)
+    suite(parties, expr, expected)
+
+
+def test_p2p_manif_session():
+    participants = {
+        "Alice": {Secret(): 500, Secret(): 50, Secret(): 1},
+        "Bob": {Secret(): 300, Secret(): 30, Secret(): 1},
+        "Eve": {Secret(): 0, Secret(): 50, Secret(): 0},
+    }
+    sponsors = {
+        "sponsor1": {Secret(): 100},
+    }
+
+    manif = Manif(participants, sponsors)
+
+    expected = 500 + 300 - 50 - 30 - 50 - 100 * 2
+    suite(manif.parties, manif.expr_to_pay, expected, session_id="manif")
+
+
+def connect_all(participants, run_id):
+    """
+    Connect the parties of a run to each other, each from its own thread.
+    """
+    comms = {}
+
+    def connect(client_id):
+        comms[client_id] = PeerCommunication(
+            "localhost", 5004, client_id, participants, run_id=run_id, host="127.0.0.1",
+            timeout=0.5
+        )
+
+    threads = [threading.Thread(target=connect, args=(client_id,)) for client_id in participants]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return comms
+
+
+def test_private_messages_keep_sender():
+    """
+    Private messages with the same label from two parties do not overwrite each other, and a
+    missing message times out.
+    """
+    participants = ["Alice", "Bob", "Charlie"]
+    server = Process(target=smc_server, args=(participants,))
+    server.start()
+    time.sleep(1)
+
+    comms = connect_all(participants, "run")
+
+    try:
+        comms["Alice"].send_private_messages("Charlie", {"label": b"from Alice"})
+        comms["Bob"].send_private_messages("Charlie", {"label": b"from Bob"})
+        charlie = comms["Charlie"]
+        with charlie.mailbox_changed:
+            assert charlie.mailbox_changed.wait_for(lambda: len(charlie.mailbox) == 2, timeout=5)
+        with pytest.raises(ValueError):
+            charlie.retrieve_private_messages(["label"])
+
+        with pytest.raises(TimeoutError):
+            charlie.retrieve_private_messages(["missing"])
+    finally:
+        for comm in comms.values():
+            comm.close()
+        server.terminate()
+        server.join()
+
+
+def test_addresses_scoped_by_run():
+    """
+    The address left on the relay server by a run which crashed is not used by the next run.
+    """
+    participants = ["Alice", "Bob"]
+    server = Process(target=smc_server, args=(participants,))
+    server.start()
+    time.sleep(1)
+
+    stale = Communication("localhost", 5004, "Alice")
+    stale.publish_message(f"crashed_{ADDRESS_LABEL}", "127.0.0.1:1")
+    comms = connect_all(participants, "next")
+    try:
+        comms["Alice"].send_private_messages("Bob", {"label": b"share"})
+        assert comms["Bob"].retrieve_private_messages(["label"]) == [b"share"]
+    finally:
+        for comm in comms.values():
+            comm.close()
+        stale.close()
+        server.terminate()
+        server.join()
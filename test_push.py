@@ -0,0 +1,126 @@
+"""
+Integration tests running the protocol over the push server.
+"""
+
+import asyncio
+import socket
+import time
+from multiprocessing import Process, Queue
+
+import pytest
+
+from expression import Scalar, Secret
+from manif import Manif
+from protocol import ProtocolSpec
+from push_communication import PushCommunication
+from push_server import PushServer, run
+from smc_party import SMCParty
+
+
+def smc_client(client_id, prot, value_dict, queue):
+    cli = SMCParty(
+        client_id,
+        "localhost",
+        5001,
+        protocol_spec=prot,
+        value_dict=value_dict,
+        transport="push"
+    )
+    res = cli.run()
+    cli.comm.close()
+    queue.put(res)
+
+
+def smc_server(args):
+    run("localhost", 5001, args)
+
+
+def suite(parties, expr, expected):
+    participants = list(parties.keys())
+    prot = ProtocolSpec(expr=expr, participant_ids=participants)
+    queue = Queue()
+
+    server = Process(target=smc_server, args=(participants,))
+    clients = [
+        Process(target=smc_client, args=(name, prot, value_dict, queue))
+        for name, value_dict in parties.items()
+    ]
+
+    server.start()
+    time.sleep(1)
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    results = [queue.get() for _ in clients]
+
+    server.terminate()
+    server.join()
+
+    for result in results:
+        assert result == expected
+
+
+def test_push_arithmetic():
+    """
+    f(a, b, c) = ((a + K0) + b ∗ K1 - c) ∗ (b ∗ c)
+    """
+    alice_secret = Secret()
+    bob_secret = Secret()
+    charlie_secret = Secret()
+
+    parties = {
+        "Alice": {alice_secret: 3},
+        "Bob": {bob_secret: 14},
+        "Charlie": {charlie_secret: 2}
+    }
+
+    expr = ((alice_secret + Scalar(8)) + bob_secret * Scalar(9) - charlie_secret) * (bob_secret * charlie_secret)
+    expected = ((3 + 8) + 14 * 9 - 2) * (14 * 2)
+    suite(parties, expr, expected)
+
+
+def test_push_manif():
+    participants = {
+        "Alice": {Secret(): 500, Secret(): 50, Secret(): 1},
+        "Bob": {Secret(): 300, Secret(): 30, Secret(): 1},
+        "Eve": {Secret(): 0, Secret(): 50, Secret(): 0},
+    }
+    sponsors = {
+        "sponsor1": {Secret(): 100},
+    }
+
+    manif = Manif(participants, sponsors)
+
+    expected = 500 + 300 - 50 - 30 - 50 - 100 * 2
+    suite(manif.parties, manif.expr_to_pay, expected)
+
+
+def test_public_message_without_readers():
+    """
+    A public message with no other participant to push it to is not kept.
+    """
+    server = PushServer(["Alice"])
+    asyncio.run(server.dispatch("Alice", {"type": "public", "label": "label"}, b"opening"))
+    server.ttp.stop()
+
+    assert server.public == {}
+    assert server.public_pending == {}
+
+
+def test_wait_message_fails():
+    """
+    Waiting for a message raises once the timeout expires, or as soon as the connection drops.
+    """
+    with socket.create_server(("localhost", 0)) as listener:
+        port = listener.getsockname()[1]
+        comm = PushCommunication("localhost", port, "Alice", timeout=0.1)
+        connection, _ = listener.accept()
+        with pytest.raises(TimeoutError):
+            comm.retrieve_private_message("label")
+
+        comm.timeout = 30.0
+        connection.close()
+        with pytest.raises(ConnectionError):
+            comm.retrieve_private_message("label")
+        comm.close()
@@ -5,6 +5,121 @@ Testing secret sharing is not obligatory.
 MODIFY THIS FILE.
 """
 
+from random import randint
+
+import pytest
+
+import secret_sharing
+from secret_sharing import (
+    DEFAULT_MODULUS,
+    MERSENNE_61,
+    PRIME_31,
+    SHARE_BYTES,
+    Share,
+    ShareVector,
+    deserialize_shares,
+    reconstruct_secret,
+    reconstruct_vector,
+    serialize_shares,
+    set_modulus,
+    share_secret,
+    share_vector,
+)
+
+
+@pytest.fixture(params=[DEFAULT_MODULUS, MERSENNE_61, PRIME_31])
+def modulus(request):
+    set_modulus(request.param)
+    yield request.param
+    set_modulus(DEFAULT_MODULUS)
+
 
 def test():
-    pass
+    secret = randint(0, Share.MODULUS - 1)
+    shares = share_secret(secret, 5)
+    assert len(shares) == 5
+    assert reconstruct_secret(shares) == secret
+
+
+def test_serialize():
+    share = Share(Share.MODULUS - 1)
+    serialized = share.serialize()
+    assert len(serialized) == SHARE_BYTES
+    assert int(Share.deserialize(serialized)) == Share.MODULUS - 1
+
+    with pytest.raises(ValueError):
+        Share.deserialize(serialized[1:])
+
+
+def test_serialize_shares():
+    shares = [Share(randint(0, Share.MODULUS - 1)) for _ in range(10)]
+    serialized = serialize_shares(shares)
+    assert [int(s) for s in deserialize_shares(serialized)] == [int(s) for s in shares]
+    assert deserialize_shares(serialize_shares([])) == []
+
+    with pytest.raises(ValueError):
+        deserialize_shares(serialized[:-1])
+
+
+def test_share_vector_arithmetic(modulus):
+    xs = [randint(0, modulus - 1) for _ in range(100)] + [modulus - 1]
+    ys = [randint(0, modulus - 1) for _ in range(100)] + [modulus - 1]
+    x, y = ShareVector(xs), ShareVector(ys)
+
+    assert list(x + y) == [(a + b) % modulus for a, b in zip(xs, ys)]
+    assert list(x - y) == [(a - b) % modulus for a, b in zip(xs, ys)]
+    assert list(x * y) == [(a * b) % modulus for a, b in zip(xs, ys)]
+    assert list(x * 3 + 1) == [(a * 3 + 1) % modulus for a in xs]
+
+
+def test_share_vector_without_numpy(modulus, monkeypatch):
+    monkeypatch.setattr(secret_sharing, "np", None)
+    xs = [randint(0, modulus - 1) for _ in range(10)]
+    ys = [randint(0, modulus - 1) for _ in range(10)]
+
+    assert list(ShareVector(xs) * ShareVector(ys)) == [(a * b) % modulus for a, b in zip(xs, ys)]
+
+
+def test_share_vector_serialize(modulus):
+    xs = [randint(0, modulus - 1) for _ in range(10)]
+    serialized = ShareVector(xs).serialize()
+    assert serialized == serialize_shares([Share(x) for x in xs])
+    assert list(ShareVector.deserialize(serialized)) == xs
+
+
+def test_share_vector_reconstruct(modulus):
+    secrets = [randint(0, modulus - 1) for _ in range(10)]
+    vectors = share_vector(secrets, 5)
+    assert len(vectors) == 5
+    assert reconstruct_vector(vectors) == secrets
+
+    secret = randint(0, modulus - 1)
+    assert reconstruct_secret(share_secret(secret, 5)) == secret
+
+
+def test_lazy_reduction():
+    x = Share(Share.MODULUS - 1)
+    total = Share()
+    for _ in range(1000):
+        total = total + x - 1
+    total = total * x * x
+
+    expected = (1000 * (Share.MODULUS - 2) * (Share.MODULUS - 1) ** 2) % Share.MODULUS
+    assert int(total) == expected
+    assert total.serialize() == Share(expected).serialize()
+    assert int(5 - x) == 6
+
+
+def test_share_vector_from_array(modulus):
+    np = pytest.importorskip("numpy")
+    xs = [randint(0, 2**64 - 1) for _ in range(10)]
+    x = ShareVector(np.array(xs, dtype=np.uint64))
+    assert list(x) == [v % modulus for v in xs]
+    assert list(x.take([3, 0, 3])) == [xs[3] % modulus, xs[0] % modulus, xs[3] % modulus]
+
+
+def test_share_vector_sum(modulus):
+    xs = [modulus - 1] * 1000 + [randint(0, modulus - 1) for _ in range(10)]
+    assert ShareVector(xs).sum() == sum(xs) % modulus
+    assert ShareVector.from_shares([Share(x) for x in xs]).sum() == sum(xs) % modulus
+    assert ShareVector().sum() == 0
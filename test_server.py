@@ -0,0 +1,124 @@
+"""
+Unit tests for the relay server, using the Flask test client.
+"""
+
+import pytest
+
+import server
+from communication import decode_batch, encode_batch, encode_keys
+
+
+@pytest.fixture
+def client():
+    server.store.clear()
+    server.readers_left.clear()
+    server.stored_at.clear()
+    server.sessions.clear()
+    server.sessions_left.clear()
+    server.metrics = server.Metrics()
+    ttp = server.TrustedParamGenerator()
+    for participant in ["Alice", "Bob", "Charlie"]:
+        ttp.add_participant(participant)
+    server.sessions[server.DEFAULT_SESSION] = ttp
+    return server.app.test_client()
+
+
+def test_private_message_evicted(client):
+    client.post("/private/Alice/Bob/label", data=b"share")
+
+    assert client.get("/private/Bob/label").data == b"share"
+    assert client.get("/private/Bob/label").status_code == 404
+    assert server.store["private"] == {}
+
+
+def test_public_message_evicted(client):
+    client.post("/public/Alice/label", data=b"opening")
+
+    assert client.get("/public/Bob/Alice/label").data == b"opening"
+    assert ("", "Alice", "label") in server.store["public"]
+    res = client.post("/batch/public/Charlie", data=encode_keys(["Alice/label"]))
+    assert decode_batch(res.data) == {"Alice/label": b"opening"}
+    assert server.store["public"] == {}
+
+
+def test_batch_private_messages(client):
+    client.post("/batch/private/Alice/Bob", data=encode_batch({"x": b"1", "y": b"2"}))
+
+    res = client.post("/batch/private/Bob", data=encode_keys(["x", "y", "z"]))
+    assert decode_batch(res.data) == {"x": b"1", "y": b"2"}
+    assert server.store["private"] == {}
+
+
+def test_stale_values_evicted(client, monkeypatch):
+    monkeypatch.setattr(server, "MAX_ENTRIES", 2)
+    for label in ["a", "b", "c"]:
+        client.post(f"/private/Alice/Bob/{label}", data=b"share")
+
+    assert list(server.store["private"]) == [("", "Bob", "b"), ("", "Bob", "c")]
+
+
+def test_sessions_isolated(client):
+    client.post("/sessions/s1", data=encode_keys(["Alice", "Bob"]))
+    client.post("/sessions/s1/private/Alice/Bob/label", data=b"s1")
+    client.post("/private/Alice/Bob/label", data=b"default")
+
+    assert client.get("/sessions/s1/private/Bob/label").data == b"s1"
+    assert client.get("/private/Bob/label").data == b"default"
+    assert client.get("/sessions/s2/shares/Alice/op").status_code == 410
+
+
+def test_unknown_session(client):
+    assert client.post("/sessions/typo/private/Alice/Bob/label", data=b"share").status_code == 410
+    assert client.post(
+        "/sessions/typo/batch/private/Alice/Bob", data=encode_batch({"label": b"share"})
+    ).status_code == 410
+    assert client.get("/sessions/typo/private/Bob/label?wait=0").status_code == 410
+    assert all(not pool for pool in server.store.values())
+
+
+def test_session_torn_down(client):
+    client.post("/sessions/s1", data=encode_keys(["Alice", "Bob"]))
+    assert client.post("/sessions/s1", data=encode_keys(["Alice", "Bob"])).status_code == 200
+    assert client.post("/sessions/s1", data=encode_keys(["Alice"])).status_code == 409
+    client.post("/sessions/s1/public/Alice/label", data=b"opening")
+
+    client.delete("/sessions/s1/Alice")
+    assert "s1" in server.sessions
+    client.delete("/sessions/s1/Bob")
+    assert "s1" not in server.sessions
+    assert server.store["public"] == {}
+
+
+def test_metrics(client):
+    client.post("/private/Alice/Bob/label", data=b"share")
+    client.post("/public/Alice/label", data=b"opening")
+    client.get("/private/Bob/label")
+
+    metrics = client.get("/metrics").get_json()
+    assert metrics["by_label"]["send_private_message"]["bytes_received"] == 5
+    assert metrics["by_label"]["retrieve_private_message"]["bytes_sent"] == 5
+    assert metrics["store"] == {"private": 0, "public": 1}
+    assert metrics["sessions"][""]["participants"] == 3
+
+
+def test_completed_triplet_retrieved_again(client):
+    shares = {p: client.get(f"/shares/{p}/op").data for p in ["Alice", "Bob", "Charlie"]}
+
+    res = client.get("/shares/Alice/op")
+    assert res.status_code == 200
+    assert res.data == shares["Alice"]
+    assert server.sessions[server.DEFAULT_SESSION].shares == {}
+
+
+def test_wait_param(client):
+    for wait in ["nan", "inf", "-inf", "soon"]:
+        assert client.get(f"/private/Bob/label?wait={wait}").status_code == 400
+
+    # A negative wait is clamped to 0: the request returns at once.
+    assert client.get("/private/Bob/label?wait=-5").status_code == 404
+
+
+def test_handlers_keep_alive():
+    assert server.KeepAliveRequestHandler.protocol_version == "HTTP/1.1"
+    assert server.QuietRequestHandler.protocol_version == "HTTP/1.1"
+    assert server.WSGIRequestHandler.protocol_version != "HTTP/1.1"
@@ -3,6 +3,11 @@ Unit tests for the trusted parameter generator.
 Testing ttp is not obligatory.
 """
 
+import threading
+
+import pytest
+
+from secret_sharing import Share, reconstruct_secret
 from ttp import TrustedParamGenerator
 
 
@@ -26,3 +31,139 @@ def test():
 
 
     
+
+
+def test_retrieve_shares():
+    ttp = TrustedParamGenerator()
+    participants = ['Elisa', 'Yassine', 'Alice']
+    for participant in participants:
+        ttp.add_participant(participant)
+
+    triplets = {p: ttp.retrieve_shares(p, ['op1', 'op2']) for p in participants}
+
+    for i, op_id in enumerate(['op1', 'op2']):
+        a, b, c = [reconstruct_secret([triplets[p][i][j] for p in participants]) for j in range(3)]
+        assert c == (a * b) % Share.MODULUS
+        assert triplets['Alice'][i] == ttp.retrieve_share('Alice', op_id)
+
+
+def test_free_retrieved_shares():
+    ttp = TrustedParamGenerator()
+    participants = ['Elisa', 'Yassine', 'Alice']
+    for participant in participants:
+        ttp.add_participant(participant)
+
+    first = ttp.retrieve_share('Elisa', 'op1')
+    assert ttp.retrieve_share('Elisa', 'op1') == first
+    ttp.retrieve_share('Yassine', 'op1')
+    ttp.retrieve_share('Alice', 'op1')
+
+    assert ttp.shares == {}
+    assert ttp.op_ids == set()
+    # A completed triplet can be retrieved again, e.g. by a party running the same op id twice.
+    assert ttp.retrieve_share('Elisa', 'op1') == first
+
+
+def test_completed_triplets_bounded():
+    ttp = TrustedParamGenerator(max_completed=2)
+    participants = ['Elisa', 'Yassine']
+    for participant in participants:
+        ttp.add_participant(participant)
+
+    for op_id in ['op1', 'op2', 'op3']:
+        for participant in participants:
+            ttp.retrieve_share(participant, op_id)
+
+    assert list(ttp.completed) == ['op2', 'op3']
+    with pytest.raises(ValueError):
+        ttp.retrieve_share('Mallory', 'op3')
+
+
+def test_pending_triplets_bounded(monkeypatch):
+    ttp = TrustedParamGenerator(max_pending=2, max_age=60)
+    participants = ['Elisa', 'Yassine']
+    for participant in participants:
+        ttp.add_participant(participant)
+
+    # Yassine never retrieves its shares, e.g. because it crashed.
+    for op_id in ['op1', 'op2', 'op3']:
+        ttp.retrieve_share('Elisa', op_id)
+    assert list(ttp.bound_at) == ['op2', 'op3']
+    assert ttp.op_ids == {'op2', 'op3'}
+    assert set(ttp.remaining) == {'op2', 'op3'}
+    assert ('op1', 'Elisa') not in ttp.shares
+
+    now = ttp.bound_at['op3']
+    monkeypatch.setattr('ttp.time.monotonic', lambda: now + 61)
+    ttp.retrieve_share('Elisa', 'op4')
+    assert list(ttp.bound_at) == ['op4']
+    assert set(ttp.shares) == {('op4', 'Elisa'), ('op4', 'Yassine')}
+
+
+def test_pool():
+    ttp = TrustedParamGenerator(low_watermark=4, high_watermark=8, batch_size=3)
+    participants = ['Elisa', 'Yassine']
+    for participant in participants:
+        ttp.add_participant(participant)
+    ttp.start()
+
+    with ttp.pool_changed:
+        assert ttp.pool_changed.wait_for(lambda: len(ttp.pool) == 8, timeout=5)
+
+    for op_id in ['op1', 'op2', 'op3', 'op4', 'op5']:
+        shares = [ttp.retrieve_share(p, op_id) for p in participants]
+        a, b, c = [reconstruct_secret([s[j] for s in shares]) for j in range(3)]
+        assert c == (a * b) % Share.MODULUS
+
+    # The pool fell below the low watermark and is refilled.
+    with ttp.pool_changed:
+        assert ttp.pool_changed.wait_for(lambda: len(ttp.pool) == 8, timeout=5)
+    ttp.stop()
+
+
+def test_lazy_start():
+    ttp = TrustedParamGenerator(low_watermark=4, high_watermark=8, batch_size=3)
+    participants = ['Elisa', 'Yassine']
+    for participant in participants:
+        ttp.add_participant(participant)
+    ttp.start(lazy=True)
+    assert ttp.worker is None and not ttp.pool
+
+    ttp.retrieve_share('Elisa', 'op1')
+    assert ttp.pool_misses == 1
+    with ttp.pool_changed:
+        assert ttp.pool_changed.wait_for(lambda: len(ttp.pool) == 8, timeout=5)
+    ttp.stop()
+
+    # A TTP stopped before any retrieval never starts its worker.
+    ttp = TrustedParamGenerator()
+    ttp.add_participant('Elisa')
+    ttp.start(lazy=True)
+    ttp.stop()
+    ttp.retrieve_share('Elisa', 'op1')
+    assert ttp.worker is None
+
+
+def test_concurrent_retrieval():
+    ttp = TrustedParamGenerator()
+    participants = [f'party{i}' for i in range(8)]
+    for participant in participants:
+        ttp.add_participant(participant)
+    ttp.start()
+
+    op_ids = [f'op{i}' for i in range(50)]
+    results = {}
+
+    def retrieve(participant):
+        results[participant] = ttp.retrieve_shares(participant, op_ids)
+
+    threads = [threading.Thread(target=retrieve, args=(p,)) for p in participants]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ttp.stop()
+
+    for i in range(len(op_ids)):
+        a, b, c = [reconstruct_secret([results[p][i][j] for p in participants]) for j in range(3)]
+        assert c == (a * b) % Share.MODULUS
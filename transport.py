@@ -0,0 +1,116 @@
+"""
+Interface of the transports through which the SMC parties communicate.
+
+An SMCParty only relies on the methods of Transport, so the protocol can run over the HTTP relay
+server (communication.Communication), the push server (push_communication.PushCommunication),
+direct connections between the parties (p2p_communication.PeerCommunication), or within a single
+process (memory_transport.MemoryTransport).
+"""
+
+import abc
+from typing import Dict, List, Tuple, Union
+
+from metrics import Metrics
+from secret_sharing import Share, ShareVector
+
+
+class Transport(abc.ABC):
+    """
+    Base class of the transports. A transport which does not implement all the abstract methods
+    cannot be built.
+
+    Attributes:
+        client_id: Identifier of this client
+        metrics: Metrics of the communications of this client
+    """
+
+    client_id: str
+    metrics: Metrics
+
+
+    @abc.abstractmethod
+    def send_private_messages(
+            self,
+            receiver_id: str,
+            messages: Dict[str, Union[bytes, str]]
+        ) -> None:
+        """
+        Send several private messages to the same receiver, indexed by label.
+        """
+
+
+    @abc.abstractmethod
+    def retrieve_private_messages(
+            self,
+            labels: List[str]
+        ) -> List[bytes]:
+        """
+        Retrieve several private messages sent to this client, waiting until all of them arrived.
+        """
+
+
+    @abc.abstractmethod
+    def publish_message(
+            self,
+            label: str,
+            message: Union[bytes, str]
+        ) -> None:
+        """
+        Publish a message to all the other participants.
+        """
+
+
+    @abc.abstractmethod
+    def retrieve_public_messages(
+            self,
+            keys: List[Tuple[str, str]]
+        ) -> List[bytes]:
+        """
+        Retrieve several public messages, given as (sender_id, label) pairs, waiting until all of
+        them arrived.
+        """
+
+
+    @abc.abstractmethod
+    def retrieve_beaver_triplet_shares(
+            self,
+            op_id: str
+        ) -> Tuple[Share, Share, Share]:
+        """
+        Retrieve the shares of this client of the Beaver triplet of an operation.
+        """
+
+
+    def retrieve_beaver_triplet_shares_batch(
+            self,
+            op_ids: List[str]
+        ) -> List[Tuple[Share, Share, Share]]:
+        """
+        Retrieve the shares of this client of the Beaver triplets of several operations.
+        """
+        return [self.retrieve_beaver_triplet_shares(op_id) for op_id in op_ids]
+
+
+    def retrieve_beaver_triplet_vectors(
+            self,
+            op_ids: List[str]
+        ) -> Tuple[ShareVector, ShareVector, ShareVector]:
+        """
+        Retrieve the shares of this client of the Beaver triplets of several operations, as the
+        vectors of the shares of a, b and c.
+        """
+        triplets = self.retrieve_beaver_triplet_shares_batch(op_ids)
+        a, b, c = (ShareVector.from_shares([triplet[i] for triplet in triplets]) for i in range(3))
+        return a, b, c
+
+
+    def leave_session(self) -> None:
+        """
+        Leave the session of the computation, for the transports which have sessions.
+        """
+
+
+    def close(self) -> None:
+        """
+        Release the resources of the transport.
+        """
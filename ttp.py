@@ -3,38 +3,128 @@ Trusted parameters generator.
 """
 
 import collections
+import threading
+import time
 from typing import (
+    Deque,
     Dict,
+    List,
+    Optional,
     Set,
     Tuple,
 )
 
-from communication import Communication
 from secret_sharing import(
-    share_secret,
+    random_field_vector,
+    share_vector,
     Share,
 )
-from random import randint
 
 
 #For this implementation to work we need all participants to be added before the shares are retrieved.
 
+# Shares of a triplet, for each participant.
+Triplet = Dict[str, Tuple[Share, Share, Share]]
+
 class TrustedParamGenerator:
     """
     A trusted third party that generates random values for the Beaver triplet multiplication scheme.
+
+    Once started, a worker thread keeps a pool of triplets generated ahead of demand: when the pool
+    falls below low_watermark triplets, it is refilled up to high_watermark. An op id is bound to a
+    triplet of the pool the first time it is requested. Without the worker, triplets are generated
+    on demand. The servers start the worker lazily, so that it only runs for the computations
+    which multiply.
+
+    Attributes:
+        low_watermark: size of the pool under which it is refilled (default: 64)
+        high_watermark: size of the pool after a refill (default: 256)
+        batch_size: number of triplets generated at once by the worker (default: 32)
+        max_completed: number of fully retrieved triplets kept, so that a participant requesting
+            one of them again gets the same shares (default: 10000)
+        max_pending: number of triplets bound to an op id but not retrieved by all the
+            participants yet, beyond which the oldest ones are dropped (default: 100000)
+        max_age: time after which a triplet not retrieved by all the participants is dropped, in
+            seconds (default: 600 s), so that the triplets of a participant which crashed or left
+            do not accumulate. A dropped op id gets a new triplet if it is requested again.
     """
 
-    def __init__(self):
+    def __init__(
+            self,
+            low_watermark: int = 64,
+            high_watermark: int = 256,
+            batch_size: int = 32,
+            max_completed: int = 10_000,
+            max_pending: int = 100_000,
+            max_age: float = 600.0
+        ):
         self.participant_ids: Set[str] = set()
-        self.shares: Dict[(str, str), Tuple[Share, Share, Share]] = {}
+        self.shares: Dict[Tuple[str, str], Tuple[Share, Share, Share]] = {}
         self.op_ids: Set[str] = set()
+        # Participants which did not retrieve the triplet of each operation yet. Once all of them
+        # did, the triplet is moved to `completed`, which only keeps the most recent ones.
+        self.remaining: Dict[str, Set[str]] = {}
+        self.completed: Dict[str, Triplet] = collections.OrderedDict()
+        self.max_completed = max_completed
+        # Time at which each triplet not retrieved by all the participants was bound to its op id,
+        # oldest first.
+        self.bound_at: Dict[str, float] = collections.OrderedDict()
+        self.max_pending = max_pending
+        self.max_age = max_age
+        # Triplets are retrieved concurrently, each op id must be bound to a single triplet.
+        self.lock = threading.RLock()
+
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.batch_size = batch_size
+        self.pool: Deque[Triplet] = collections.deque()
+        self.pool_changed = threading.Condition()
+        self.worker: Optional[threading.Thread] = None
+        self.stopped = False
+        # Whether the worker is started by the first triplet bound to an operation.
+        self.start_on_demand = False
+        # Number of triplets generated on demand because the pool was empty.
+        self.pool_misses = 0
 
 
     def add_participant(self, participant_id: str) -> None:
         """
         Add a participant.
         """
-        self.participant_ids.add(participant_id)
+        with self.pool_changed:
+            self.participant_ids.add(participant_id)
+            # The triplets of the pool were shared among the previous participants.
+            self.pool.clear()
+            self.pool_changed.notify_all()
+
+    def start(self, lazy: bool = False) -> None:
+        """
+        Start the worker filling the pool of triplets. If lazy, the worker is only started by the
+        first triplet bound to an operation, so that a computation without multiplications does
+        not fill the pool.
+        """
+        with self.pool_changed:
+            if lazy:
+                self.start_on_demand = self.worker is None
+            elif self.worker is None:
+                self.start_on_demand = False
+                self.stopped = False
+                self.worker = threading.Thread(target=self._fill_pool, daemon=True)
+                self.worker.start()
+
+    def stop(self) -> None:
+        """
+        Stop the worker filling the pool of triplets.
+        """
+        with self.pool_changed:
+            self.start_on_demand = False
+            worker = self.worker
+            if worker is None:
+                return
+            self.stopped = True
+            self.pool_changed.notify_all()
+        worker.join()
+        self.worker = None
 
     def retrieve_share(self, client_id: str, op_id: str) -> Tuple[Share, Share, Share]:
         """
@@ -42,29 +132,134 @@ class TrustedParamGenerator:
         """
         if client_id not in self.participant_ids :
             raise ValueError("Client ID not valid")
-        if op_id not in self.op_ids: 
-            self.gen_beaver_triplet(op_id)
-            self.op_ids.add(op_id)
+        with self.lock:
+            if op_id in self.completed:
+                return self.completed[op_id][client_id]
+            if op_id not in self.op_ids:
+                self.gen_beaver_triplet(op_id)
+                self.op_ids.add(op_id)
+                self.remaining[op_id] = set(self.participant_ids)
+                now = time.monotonic()
+                self.bound_at[op_id] = now
+                self._drop_stale(now)
+
+            shares = self.shares[(op_id,client_id)]
+            self.remaining[op_id].discard(client_id)
+            if not self.remaining[op_id]:
+                self._free(op_id)
+            return shares
+
+    def retrieve_shares(self, client_id: str, op_ids: List[str]) -> List[Tuple[Share, Share, Share]]:
+        """
+        Retrieve the triplets of shares of several operations for a given client_id.
+        """
+        with self.lock:
+            return [self.retrieve_share(client_id, op_id) for op_id in op_ids]
+
+    def _free(self, op_id: str) -> None:
+        """
+        Move the shares of an operation retrieved by all the participants to the bounded record of
+        completed triplets.
+        """
+        self.completed[op_id] = {
+            client_id: self.shares.pop((op_id, client_id))
+            for client_id in self.participant_ids if (op_id, client_id) in self.shares
+        }
+        self.op_ids.discard(op_id)
+        del self.remaining[op_id]
+        del self.bound_at[op_id]
+
+        if len(self.completed) > self.max_completed:
+            self.completed.popitem(last=False) # type: ignore
+
+    def _drop_stale(self, now: float) -> None:
+        """
+        Drop the oldest triplets not retrieved by all the participants, while they are older than
+        max_age or there are more than max_pending of them.
+        """
+        while self.bound_at:
+            op_id = next(iter(self.bound_at))
+            if len(self.bound_at) <= self.max_pending and now - self.bound_at[op_id] <= self.max_age:
+                break
+            for client_id in self.participant_ids:
+                self.shares.pop((op_id, client_id), None)
+            self.op_ids.discard(op_id)
+            del self.remaining[op_id]
+            del self.bound_at[op_id]
 
-        return self.shares[(op_id,client_id)]
-        
     def gen_beaver_triplet(self, op_id: str) -> None:
         """
-        Generate a beaver triplet and it's secret shares for each participant.
+        Bind a beaver triplet to an operation, taking it from the pool if possible.
         """
-        a = randint(0, Share.MODULUS )
-        b = randint(0, Share.MODULUS )
-        c = (a * b) % Share.MODULUS
-        
-        num_shares = len(self.participant_ids)
-        
-        shares_a = share_secret(a, num_shares)
-        shares_b = share_secret(b, num_shares)
-        shares_c = share_secret(c, num_shares)
+        with self.pool_changed:
+            if self.start_on_demand:
+                self.start()
+            triplet = self.pool.popleft() if self.pool else None
+            if triplet is None:
+                self.pool_misses += 1
+            if len(self.pool) < self.low_watermark:
+                self.pool_changed.notify_all()
+        if triplet is None:
+            triplet = self.gen_beaver_triplets(1)[0]
+
+        for client_id, shares in triplet.items():
+            self.shares[(op_id, client_id)] = shares
+
+    def gen_beaver_triplets(
+            self,
+            count: int,
+            participant_ids: Optional[List[str]] = None
+        ) -> List[Triplet]:
+        """
+        Generate beaver triplets and their secret shares for each participant.
+        The triplets are drawn and shared as vectors, all at once.
+        """
+        client_ids = participant_ids if participant_ids is not None else list(self.participant_ids)
+        num_shares = len(client_ids)
+        a, b = random_field_vector(count), random_field_vector(count)
+        c = a * b
+
+        # Shares of each participant of a, b and c.
+        shares = [
+            [vector.to_shares() for vector in share_vector(values, num_shares)]
+            for values in (a, b, c)
+        ]
+        triplets = [
+            {
+                client_id: (shares[0][i][t], shares[1][i][t], shares[2][i][t])
+                for i, client_id in enumerate(client_ids)
+            }
+            for t in range(count)
+        ]
+        return triplets
+
+    def _fill_pool(self) -> None:
+        """
+        Worker refilling the pool of triplets up to the high watermark, each time it falls below
+        the low watermark.
+        """
+        while True:
+            with self.pool_changed:
+                self.pool_changed.wait_for(
+                    lambda: self.stopped or (
+                        len(self.participant_ids) > 0 and len(self.pool) < self.low_watermark
+                    )
+                )
+
+            while True:
+                with self.pool_changed:
+                    if self.stopped:
+                        return
+                    if len(self.pool) >= self.high_watermark:
+                        break
+                    participant_ids = list(self.participant_ids)
+                    count = min(self.batch_size, self.high_watermark - len(self.pool))
 
-        
-        for i, client_id in enumerate(self.participant_ids):
-            self.shares[(op_id, client_id)] = (shares_a[i], shares_b[i], shares_c[i])
-            #TODO : How  are the beaver triplets communicated ???
+                # Generating the triplets is the expensive part, done without holding the lock.
+                triplets = self.gen_beaver_triplets(count, participant_ids)
 
-    
+                with self.pool_changed:
+                    # Drop the triplets if a participant was added in the meantime.
+                    if set(participant_ids) == self.participant_ids:
+                        self.pool.extend(triplets)
+                        self.pool_changed.notify_all()